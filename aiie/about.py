@@ -10,8 +10,6 @@ pd.options.plotting.backend = "plotly"
 # df = st.session_state.data
 # C = st.session_state.columns
 
-df, C = get_clean_data()
-
 st.write(
     """
     # AI Incidents Explorer
@@ -25,6 +23,9 @@ st.write(
 
 st.divider()
 
+# loaded once the introduction is on screen
+df, C = get_clean_data()
+
 with st.container(border=False):
     cols = st.columns(3, gap="large")
     cols[0].metric("Total incidents", df.index.size)
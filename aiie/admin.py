@@ -0,0 +1,66 @@
+import pandas as pd
+import plotly.express as px
+import streamlit as st
+from tracing import TRACE_FILE, TRACER
+
+
+# Only listed in the sessions opened with ?admin=<AIIE_ADMIN_TOKEN> (see app.py)
+def traces():
+    st.markdown("# 🛠️ Tracing")
+    st.caption(
+        "The timing spans of the reruns of this server process, by page. "
+        "A span includes the spans nested in it (e.g. a page includes its plots)."
+    )
+
+    # the spans of this page would change the options of the selectboxes (and reset them)
+    summary = TRACER.summary()
+    summary = summary[summary["page"] != "Tracing"]
+    if summary.empty:
+        st.info("No span recorded yet, browse the other pages first.", icon="💡")
+        return
+
+    cols = st.columns(2)
+    page = cols[0].selectbox("Page", summary["page"].unique())
+    summary = summary[summary["page"] == page]
+    name = cols[1].selectbox("Span", summary["span"])
+
+    st.dataframe(
+        summary.drop(columns="page").round(1),
+        use_container_width=True,
+        hide_index=True,
+    )
+
+    st.markdown(f"#### Durations of `{name}`")
+    histogram = TRACER.histogram(page, name)
+    fig = px.bar(
+        x=histogram.index, y=histogram.to_numpy(), labels={"x": "duration", "y": "spans"}
+    )
+    st.plotly_chart(fig, use_container_width=True)
+
+    spans = TRACER.recent_spans()
+    spans = spans[(spans["page"] == page) & (spans["name"] == name)]
+    st.markdown("#### Slowest recent spans")
+    st.dataframe(
+        spans.nlargest(20, "duration").assign(
+            start=lambda x: pd.to_datetime(x["start"], unit="s"),
+            duration=lambda x: (x["duration"] * 1000).round(1),
+        ),
+        use_container_width=True,
+        hide_index=True,
+        column_config={"duration": st.column_config.NumberColumn("duration (ms)")},
+    )
+
+    cols = st.columns(2)
+    cols[0].download_button(
+        "Export the recent spans (JSON lines)",
+        TRACER.json_lines(),
+        file_name="spans.jsonl",
+        mime="application/jsonl",
+        use_container_width=True,
+    )
+    if cols[1].button("Reset", use_container_width=True):
+        TRACER.reset()
+        st.rerun()
+
+    if TRACE_FILE:
+        st.caption(f"All the spans are also appended to `{TRACE_FILE}`.")
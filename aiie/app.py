@@ -1,8 +1,12 @@
+import importlib
+import os
+
 import numpy as np
 import pandas as pd
 import streamlit as st
 from box import Box
-from data import get_clean_data
+from data import get_clean_data, get_dataset, get_session_mask, set_session_mask
+from tracing import span, trace_page, traced
 from utils import (
     _df_groupby,
     category_text_filter,
@@ -19,8 +23,6 @@ st.set_page_config(
     initial_sidebar_state="expanded",
 )
 
-from plotting import interactions, rankings, sankey, timeline, umap
-
 st.html("""
   <style>
     [alt=Logo] {
@@ -33,6 +35,25 @@ st.logo(image="img/logo.png", link="http://aiiexp.streamlit.app")
 pd.options.plotting.backend = "plotly"
 
 
+@st.cache_resource(show_spinner=False)
+def start_umap_warmup():
+    """Warms (once per process) a job worker up for UMAP, in the background."""
+    # imported here, the startup does not wait for the UMAP machinery
+    from embeddings import submit_umap_warmup
+
+    return submit_umap_warmup()
+
+
+# the first UMAP of the process should not pay for the compilation of numba
+start_umap_warmup()
+
+# The rows around the selected one whose description is prefetched
+PREFETCH_ROWS = 5
+
+# The tracing page is only listed in the sessions opened with ?admin=<this token>
+ADMIN_TOKEN = os.environ.get("AIIE_ADMIN_TOKEN")
+
+
 def make_layout():
     layout = Box()
 
@@ -49,6 +70,7 @@ def make_layout():
     return layout
 
 
+@traced
 def show_raw_data(container, sidebar, total, df, C):
     columns_to_filter_on = [
         # C.occurred,
@@ -62,18 +84,17 @@ def show_raw_data(container, sidebar, total, df, C):
         C.media_trigger,
     ]
 
-    df = df[st.session_state.mask]
+    # the filters work on the whole dataset and only narrow the mask down
+    mask = get_session_mask(df.index.size)
     with container:
-        st.session_state.mask &= dataframe_with_filters(
-            df, on_columns=columns_to_filter_on, mask=st.session_state.mask
-        )
-    df = df[st.session_state.mask]
+        mask &= dataframe_with_filters(df, on_columns=columns_to_filter_on, mask=mask)
 
     with sidebar:
         # Display the filtering widgets
-        st.session_state.mask &= category_text_filter(
-            df, st.session_state.mask, columns_to_filter_on
-        )
+        mask &= category_text_filter(df, mask, columns_to_filter_on)
+
+    set_session_mask(mask)
+    df = df[mask]
 
     with container:
         selected_row = st.dataframe(
@@ -106,17 +127,45 @@ def show_raw_data(container, sidebar, total, df, C):
         incident_index = selected_row.selection.rows[0]
         incident = df.iloc[incident_index]
 
-        show_incident_description(incident[C.summary_links])
+        show_incident_description(incident.name, incident[C.summary_links])
+
+        # the next and previous rows are likely the next ones to be selected
+        neighbours = np.arange(1, PREFETCH_ROWS + 1)
+        positions = np.stack([incident_index + neighbours, incident_index - neighbours])
+        prefetch_descriptions(df, C, positions.T.ravel())
     else:
         st.info("Select a row to display more info ", icon="⤴")
+        prefetch_descriptions(df, C, np.arange(PREFETCH_ROWS))
 
     total.metric("Total incidents", df.index.size)
 
 
+def prefetch_descriptions(df, C, positions):
+    """Fetches the pages of some rows of the view in the background (nearest first)."""
+    # imported with the first selection, the startup does not wait for the HTML parsers
+    from descriptions import get_description_store
+    from scraping import get_prefetcher
+
+    positions = positions[(positions >= 0) & (positions < len(df))]
+    rows = df.iloc[positions]
+
+    # the crawled incidents are already in the description store
+    rows = rows[~rows.index.isin(get_description_store().get(rows.index).index)]
+    links = rows[C.summary_links].dropna()
+    get_prefetcher().prefetch(links[links.str.startswith("http")])
+
+
 @st.fragment
-def show_incident_description(link):
+def show_incident_description(incident_id, link):
+    from descriptions import get_description_store
+
     try:
-        incident_description = scrap_incident_description(link)
+        # the crawled descriptions first, the page is only scraped when missing
+        description = get_description_store().get([incident_id])
+        if len(description):
+            incident_description = description.iloc[0]
+        else:
+            incident_description = scrap_incident_description(link)
         st.info(incident_description, icon="📄")
     except:
         st.error("An error occurred. The incident information could not be downloaded.")
@@ -128,6 +177,7 @@ def show_incident_description(link):
     )
 
 
+@traced
 def show_plots(container, sidebar, df, C):
     columns_to_plot = [
         C.country,
@@ -143,15 +193,23 @@ def show_plots(container, sidebar, df, C):
         C.purpose,
     ]
 
-    df = df[st.session_state.mask]
+    df = df[get_session_mask(df.index.size)]
 
     top_N = 10
     # with sidebar:
     #     top_N = st.select_slider(
     #         "Plot only the most frequent...", [5, 10, 15, 20, 25, 30, 40, 50, "all"], 25
     #     )
+    with sidebar:
+        cols = st.columns(2)
+        enable_topic_modeling = cols[0].toggle("Topic analysis", False)
+        if enable_topic_modeling:
+            n_components = cols[1].slider("Number of topics", 1, 20, value=9, step=1)
+
     with container:
-        plots_tabs = st.tabs(columns_to_plot)
+        plots_tabs = st.tabs(
+            columns_to_plot + ["Topic analysis"] * enable_topic_modeling
+        )
         for i, col in enumerate(columns_to_plot):
             if top_N != "all":
                 df_filtered = retain_most_frequent_values(df, col, int(top_N))
@@ -164,13 +222,62 @@ def show_plots(container, sidebar, df, C):
                 .plot(kind="barh")
                 .update_layout(showlegend=False)
             )
-            plots_tabs[i].plotly_chart(count_plot, use_container_width=True)
+            with span("st.plotly_chart"):
+                plots_tabs[i].plotly_chart(count_plot, use_container_width=True)
+
+    if enable_topic_modeling:
+        with plots_tabs[-1]:
+            show_topics(df, n_components)
+
+
+@traced
+def show_topics(df, n_components, n_top_words=10, n_cols=3):
+    """The topics of the descriptions, with their prevalence among the incidents shown."""
+    # imported when the topics are first asked for, the startup does not wait for scikit-learn
+    from topics import get_topic_model, topic_prevalence
+
+    # fitted once per version of the sheet over all the descriptions (in the background),
+    # the filters only average the topic distributions of the incidents shown
+    dataset = get_dataset()
+    topic_model = get_topic_model(dataset.version, dataset.df.index, n_components)
+    if topic_model is None:
+        return
+
+    prevalence = topic_prevalence(topic_model, df.index)
+    for idx, topic in enumerate(topic_model.components):
+        if idx % n_cols == 0:
+            topics_cols = st.columns(n_cols)
+        top_features_ind = topic.argsort()[-n_top_words:]
+        df_topic = pd.DataFrame(
+            {"word": topic_model.words[top_features_ind], "weight": topic[top_features_ind]}
+        ).set_index("word")
+        topics_cols[idx % n_cols].plotly_chart(
+            df_topic.plot.barh(
+                title=f"Topic {idx + 1} ({prevalence.get(idx, 0):.0%})"
+            ).update_layout(showlegend=False),
+            use_container_width=True,
+        )
+
+
+def deferred_page(module: str, name: str):
+    """A page running the function `name` of a module, imported when the page is first run.
+
+    The plots pages pull plotly, scipy and the UMAP machinery in,
+    the other pages should not wait for them.
+    """
+
+    def page():
+        getattr(importlib.import_module(module), name)()
+
+    # the url path of the page is the name of its function
+    page.__name__ = name
+    return page
 
 
 def main():
     # get the clean dataset along with the enum mapping of the columns (C)
     df, C = get_clean_data()
-    st.session_state.mask = np.full_like(df.index, True, dtype=bool)
+    set_session_mask(np.full_like(df.index, True, dtype=bool))
 
     # build the overall layout, creating st.container()s and st.empty()s
     layout = make_layout()
@@ -186,12 +293,29 @@ pages = {
     ],
     "Plots": [
         # st.Page("plots.py", title="Timeline", icon="📈"),
-        st.Page(timeline, title="Timeline", icon="⏳"),
-        st.Page(rankings, title="Rankings", icon="🏆"),
-        st.Page(sankey, title="Sankey", icon="🤓"),
-        st.Page(interactions, title="Interactions", icon="📊"),
-        st.Page(umap, title="UMAP", icon="✨"),
+        st.Page(deferred_page("plotting", "timeline"), title="Timeline", icon="⏳"),
+        st.Page(deferred_page("plotting", "rankings"), title="Rankings", icon="🏆"),
+        st.Page(deferred_page("plotting", "sankey"), title="Sankey", icon="🤓"),
+        st.Page(
+            deferred_page("plotting", "interactions"), title="Interactions", icon="📊"
+        ),
+        st.Page(deferred_page("plotting", "umap"), title="UMAP", icon="✨"),
     ],
 }
+
+
+def is_admin() -> bool:
+    # remembered by the session, the query parameter goes away with the first navigation
+    if ADMIN_TOKEN and st.query_params.get("admin") == ADMIN_TOKEN:
+        st.session_state["admin"] = True
+    return st.session_state.get("admin", False)
+
+
+if is_admin():
+    pages["Admin"] = [st.Page(deferred_page("admin", "traces"), title="Tracing", icon="🛠️")]
+
 pg = st.navigation(pages)
-pg.run()
+
+# every rerun is timed, with the spans of the functions it calls, by page
+with trace_page(pg.title):
+    pg.run()
@@ -0,0 +1,114 @@
+import hashlib
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+from encoding import MultiHot
+from scipy import stats
+
+
+def mask_fingerprint(mask: np.ndarray | None) -> str:
+    """A short hash identifying a mask (the masks themselves are not hashed by the cache)."""
+    if mask is None:
+        return "all"
+    return hashlib.sha1(np.packbits(mask).tobytes()).hexdigest()
+
+
+def cooccurrence_matrix(
+    x: MultiHot, y: MultiHot, mask: np.ndarray | None = None
+) -> pd.DataFrame:
+    """Counts the rows having each (y value, x value) pair.
+
+    With X and Y the multi-hot matrices of the two columns, this is the sparse product Yᵀ·X.
+
+    Args:
+        x (MultiHot): The encoding of the column on the X axis
+        y (MultiHot): The encoding of the column on the Y axis
+        mask (np.ndarray, optional): The rows to count. Defaults to all of them.
+    Returns:
+        pd.DataFrame: The (y values x x values) counts
+    """
+    x_matrix, y_matrix = x.matrix, y.matrix
+    if mask is not None:
+        x_matrix, y_matrix = x_matrix[mask], y_matrix[mask]
+
+    return pd.DataFrame(
+        (y_matrix.T @ x_matrix).toarray(), index=y.vocabulary, columns=x.vocabulary
+    )
+
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def cached_cooccurrence_matrix(
+    version: str, x_col: str, y_col: str, fingerprint: str, _dataset, _mask=None
+) -> pd.DataFrame:
+    # only the version, the axes and the fingerprint of the mask make the cache key
+    return cooccurrence_matrix(_dataset.multi_hot(x_col), _dataset.multi_hot(y_col), _mask)
+
+
+def value_frequencies(encoding: MultiHot, mask: np.ndarray | None = None) -> pd.Series:
+    """Counts the rows having each value (the column sums of the multi-hot matrix)."""
+    matrix = encoding.matrix if mask is None else encoding.matrix[mask]
+    return pd.Series(np.asarray(matrix.sum(axis=0)).ravel(), index=encoding.vocabulary)
+
+
+def top_values(frequency: pd.Series, top_n) -> pd.Index:
+    """The top N (or "All") most frequent values, most frequent first."""
+    frequency = frequency.sort_values(ascending=False, kind="stable")
+    if top_n != "All":
+        return frequency.index[:top_n]
+    return frequency.index
+
+
+def association_statistics(
+    counts: pd.DataFrame, x_frequency: pd.Series, y_frequency: pd.Series, n: int
+) -> dict[str, pd.DataFrame]:
+    """Measures how much more (or less) often than by chance each pair of values occurs.
+
+    Every cell of the co-occurrence matrix is the corner of a 2x2 contingency table
+    (with/without the y value, with/without the x value), all of them are computed at once.
+
+    Args:
+        counts (pd.DataFrame): The (y values x x values) co-occurrence counts
+        x_frequency (pd.Series): The number of rows having each x value
+        y_frequency (pd.Series): The number of rows having each y value
+        n (int): The total number of rows
+    Returns:
+        dict[str, pd.DataFrame]: The lift, the normalized PMI, the chi-square statistic
+        and the p-values of the chi-square test and of Fisher's exact test (one-sided,
+        for an over-representation), all shaped like the counts
+    """
+    a = counts.to_numpy(dtype=float)
+    r = y_frequency.reindex(counts.index).to_numpy(dtype=float)[:, None]
+    k = x_frequency.reindex(counts.columns).to_numpy(dtype=float)[None, :]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        lift = a * n / (r * k)
+
+        # log(p(x, y) / p(x)p(y)), normalized by -log(p(x, y)) into [-1, 1]
+        npmi = np.log(lift) / -np.log(a / n)
+        npmi[a == 0] = -1.0
+        npmi[a == n] = 1.0
+
+        chi2 = n * (a * (n - r - k + a) - (r - a) * (k - a)) ** 2
+        chi2 /= r * (n - r) * k * (n - k)
+
+    p_chi2 = stats.chi2.sf(chi2, df=1)
+    p_fisher = stats.hypergeom.sf(a - 1, n, r, k)
+
+    return {
+        name: pd.DataFrame(values, index=counts.index, columns=counts.columns)
+        for name, values in {
+            "lift": lift,
+            "npmi": npmi,
+            "chi2": chi2,
+            "p_chi2": p_chi2,
+            "p_fisher": p_fisher,
+        }.items()
+    }
+
+
+def is_significant(p_values: pd.DataFrame, alpha: float = 0.05) -> pd.DataFrame:
+    """Benjamini-Hochberg correction of the p-values of all the cells, at the given FDR."""
+    p = np.nan_to_num(p_values.to_numpy(dtype=float), nan=1.0)
+    q = stats.false_discovery_control(p.ravel(), method="bh").reshape(p.shape)
+    return pd.DataFrame(q < alpha, index=p_values.index, columns=p_values.columns)
@@ -0,0 +1,164 @@
+import argparse
+import logging
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlsplit
+
+import requests
+from data import C, build_snapshot, load_snapshot
+from descriptions import DESCRIPTIONS_DB, DescriptionStore
+from fetch import CONNECT_TIMEOUT, FetchClient
+from scraping import parse_incident_description, parse_list_of_links
+
+logger = logging.getLogger(__name__)
+
+
+class HostRateLimiter:
+    """Spaces the requests to a same host out, whatever the number of threads.
+
+    Args:
+        rate (float): The maximum number of requests per second to each host
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate
+        self.lock = threading.Lock()
+        self.next_slot = {}
+
+    def wait(self, url: str):
+        host = urlsplit(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.interval
+        # sleep outside of the lock, the other hosts are not held back
+        time.sleep(slot - now)
+
+
+def fetch_page(
+    client: FetchClient, url: str, validators: tuple = (None, None)
+) -> requests.Response:
+    """GETs a page, conditionally when its validators are known.
+
+    Args:
+        client (FetchClient): The (shared) client, it retries the transient failures
+        url (str): The page
+        validators (tuple, optional): The ETag and Last-Modified of the last fetch
+    Returns:
+        requests.Response: The response (a 304 when the page has not changed)
+    """
+    etag, last_modified = validators
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    return client.get(url, headers=headers)
+
+
+def crawl(
+    pages,
+    store: DescriptionStore,
+    concurrency: int = 8,
+    rate: float = 2.0,
+    retries: int = 3,
+    backoff: float = 1.0,
+    timeout: float = 30,
+) -> Counter:
+    """Fetches the incident pages concurrently and saves their description and links to the store.
+
+    Args:
+        pages (iterable): (incident id, page url) pairs
+        store (DescriptionStore): Where the descriptions are saved
+        concurrency (int, optional): The number of pages fetched at once. Defaults to 8.
+        rate (float, optional): The maximum requests per second to each host. Defaults to 2.
+        retries, backoff (optional): See `FetchClient`
+        timeout (float, optional): The read timeout, in seconds. Defaults to 30.
+    Returns:
+        Counter: The number of pages "fetched", "not modified" and "failed"
+    """
+    pages = dict(pages)
+    known = store.validators(pages)
+    limiter = HostRateLimiter(rate)
+
+    # its own pool, sized for the crawl, and its own breaker:
+    # once the site keeps failing, the remaining pages fail fast
+    client = FetchClient(
+        pool_size=concurrency,
+        retries=retries,
+        backoff=backoff,
+        timeout=(CONNECT_TIMEOUT, timeout),
+        throttle=limiter.wait,
+    )
+
+    def crawl_page(incident_id, url):
+        # the validators only apply to the same url
+        stored_url, etag, last_modified = known.get(incident_id, (None, None, None))
+        validators = (etag, last_modified) if stored_url == url else (None, None)
+
+        response = fetch_page(client, url, validators)
+        if response.status_code == 304:
+            store.touch([incident_id])
+            return "not modified"
+
+        html = response.text
+        store.put_many(
+            [
+                (
+                    incident_id,
+                    url,
+                    parse_incident_description(html),
+                    parse_list_of_links(html),
+                    response.headers.get("ETag"),
+                    response.headers.get("Last-Modified"),
+                )
+            ]
+        )
+        return "fetched"
+
+    stats = Counter()
+    with ThreadPoolExecutor(concurrency, thread_name_prefix="aiie-crawler") as pool:
+        futures = {
+            pool.submit(crawl_page, incident_id, url): url
+            for incident_id, url in pages.items()
+        }
+        for i, future in enumerate(as_completed(futures), 1):
+            try:
+                stats[future.result()] += 1
+            except Exception as error:
+                logger.warning("Could not crawl %s: %s", futures[future], error)
+                stats["failed"] += 1
+            if i % 50 == 0 or i == len(futures):
+                logger.info("%d/%d pages crawled %s", i, len(futures), dict(stats))
+
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Prefetch the description and the source links of every incident."
+    )
+    parser.add_argument("--csv", default="downloaded_sheet.csv", help="The downloaded sheet.")
+    parser.add_argument("--db", default=DESCRIPTIONS_DB, help="The SQLite database.")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=2.0, help="Requests/s per host.")
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("--limit", type=int, help="Only crawl the first incidents.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    df = load_snapshot(build_snapshot(args.csv))
+    links = df[C.summary_links].dropna()
+    links = links[links.str.startswith("http")].iloc[: args.limit]
+
+    stats = crawl(
+        links.items(),
+        DescriptionStore(args.db),
+        concurrency=args.concurrency,
+        rate=args.rate,
+        retries=args.retries,
+    )
+    print(dict(stats))
@@ -1,15 +1,60 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
 from enum import StrEnum
+from functools import cached_property, lru_cache
+from pathlib import Path
 
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
 import requests
 import streamlit as st
-from bs4 import BeautifulSoup
+from encoding import (
+    SYNONYMS,
+    MultiHot,
+    Values,
+    from_arrow,
+    multi_hot,
+    normalize,
+    take,
+    to_arrow,
+)
+from facets import SEMICOLON_SEPARATOR, VALUES_SEPARATOR, FacetEngine
+from fetch import get_fetch_client
+from taxonomy import load_taxonomy, unmapped_values
+from text_index import TrigramIndex
+from tracing import traced
 
 AIAAIC_SHEET_ID = "1Bn55B4xz21-_Rgdr8BBb2lt0n_4rzLGxFADMlVW0PYI"
 AIAAIC_SHEET_NAME = "Repository"
+AIAAIC_SHEET_CSV_URL = "https://docs.google.com/spreadsheets/d/1Bn55B4xz21-_Rgdr8BBb2lt0n_4rzLGxFADMlVW0PYI/export?format=csv&gid=888071280"
 
 TTL = 30 * 60 * 24
 
+# Where the derived artifacts (snapshots, models, caches...) are written.
+# Everything in there can be safely deleted, it is rebuilt on demand.
+CACHE_DIR = Path(os.environ.get("AIIE_CACHE_DIR", ".cache"))
+SNAPSHOT_DIR = CACHE_DIR / "snapshots"
+
+# The values of the new versions of the sheet that the taxonomy does not know yet
+TAXONOMY_REPORT = CACHE_DIR / "taxonomy_report.json"
+
+# Bump this whenever `clean_data` changes its output,
+# so that the snapshots built by an older version are not picked up.
+SNAPSHOT_VERSION = 3
+
+logger = logging.getLogger(__name__)
+
+# The dataset is shared by all the sessions of the process,
+# copy-on-write guarantees that a page modifying "its" dataframe
+# never modifies the shared one.
+pd.options.mode.copy_on_write = True
+
 
 # Conveniency column enum
 # Provides auto completion
@@ -50,23 +95,56 @@ class C(StrEnum):
     summary_links = "Description/links"
 
 
+# The categorical columns normalized at ingest (a single value is a list of one)
+MULTI_VALUED_COLUMNS = [
+    C.type,
+    C.country,
+    C.sector,
+    C.operator,
+    C.developer,
+    C.technology,
+    C.purpose,
+    C.media_trigger,
+    C.risks,
+    C.transparency,
+]
+
+# The values of these columns may contain commas (e.g. "Meta Platforms, Inc.",
+# "Replicate voice, face"), they are only split on the semicolons.
+# The others also are on the commas, as they always were (see `clean_data`).
+SEMICOLON_SEPARATED = {C.type, C.operator, C.developer, C.purpose}
+
+# The normalized values of a column are stored next to it, as "values:<column>"
+VALUES_PREFIX = "values:"
+
+
 # Load the actual AIAAIC repository (list of incidents)
 # It used to be downloaded from the online repo
 # but due to frequent changes in the sheet format
 # I ended up using an offline (potentially not up to date) version
-def get_repository_data():
-    try:
-        download_public_sheet_as_csv(
-            "https://docs.google.com/spreadsheets/d/1Bn55B4xz21-_Rgdr8BBb2lt0n_4rzLGxFADMlVW0PYI/export?format=csv&gid=888071280"
-        )
-    except requests.exceptions.RequestException as e:
-        st.toast(
-            "The online repository could not be downloaded. Using a potentially old version."
-        )
-        # st.error(f"An error occurred: {e}")
+def get_repository_data(filename="downloaded_sheet.csv"):
+    update_repository_data(filename)
+    return read_repository_csv(filename)
+
+
+def update_repository_data(filename="downloaded_sheet.csv"):
+    # the very first download is blocking, there is nothing to show otherwise
+    if not os.path.exists(filename):
+        try:
+            download_public_sheet_as_csv(AIAAIC_SHEET_CSV_URL, filename)
+        except requests.exceptions.RequestException as e:
+            st.toast(
+                "The online repository could not be downloaded. Using a potentially old version."
+            )
+            # st.error(f"An error occurred: {e}")
+
+    # the following ones happen in the background, outside of the reruns
+    start_background_refresh(AIAAIC_SHEET_CSV_URL, filename)
 
+
+def read_repository_csv(filename="downloaded_sheet.csv"):
     df = (
-        pd.read_csv("downloaded_sheet.csv", skip_blank_lines=True, skiprows=[0, 2])
+        pd.read_csv(filename, skip_blank_lines=True, skiprows=[0, 2])
         .dropna(how="all")
         .dropna(axis=1, how="all")
     )
@@ -75,32 +153,152 @@ def get_repository_data():
     return df
 
 
-@st.cache_data(ttl=TTL, show_spinner="Fetchez la data... 🐮")
-def download_public_sheet_as_csv(csv_url, filename="downloaded_sheet.csv"):
-    """Downloads a public Google Sheet as a CSV file.
+def download_public_sheet_as_csv(
+    csv_url, filename="downloaded_sheet.csv", timeout=None, client=None
+) -> bool:
+    """Downloads a public Google Sheet as a CSV file, if it changed since the last download.
+
+    The ETag/Last-Modified headers of the previous download are sent back
+    to let the server skip the transfer, and the content hash is compared
+    for the servers that ignore them. The file is replaced atomically,
+    the sessions reading it never see a partial download.
 
     Args:
         csv_url (str): The CSV download URL of the Google Sheet.
         filename (str, optional): The filename for the downloaded CSV file. Defaults to "downloaded_sheet.csv".
+        timeout (float or tuple, optional): Connect/read timeouts, in seconds. Defaults to the ones of the fetch client.
+        client (FetchClient, optional): Defaults to the shared one.
+
+    Returns:
+        bool: Whether the content of the file changed.
     """
-    response = requests.get(csv_url)
-    response.raise_for_status()  # Check for HTTP errors
+    meta_path = CACHE_DIR / f"{Path(filename).name}.meta.json"
+    meta = json.loads(meta_path.read_text()) if meta_path.exists() else {}
+
+    # the validators only make sense if the file is the one they were issued for
+    headers = {}
+    if os.path.exists(filename) and meta.get("digest") == file_digest(filename):
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    # retried, and short-circuited while Google keeps failing (the current file is kept)
+    client = client or get_fetch_client()
+    response = client.get(csv_url, headers=headers, timeout=timeout)
+    if response.status_code == 304:
+        return False
+
+    digest = hashlib.sha256(response.content).hexdigest()[:16]
+    changed = not os.path.exists(filename) or digest != file_digest(filename)
+    if changed:
+        tmp_filename = temporary_path(filename)
+        with open(tmp_filename, "wb") as f:
+            f.write(response.content)
+        os.replace(tmp_filename, filename)
+
+    meta = {
+        "url": csv_url,
+        "digest": digest,
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "downloaded_at": time.time(),
+    }
+    meta_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_meta_path = temporary_path(meta_path)
+    tmp_meta_path.write_text(json.dumps(meta))
+    os.replace(tmp_meta_path, meta_path)
+
+    return changed
+
+
+def refresh_repository_data(csv_url, filename="downloaded_sheet.csv", client=None) -> bool:
+    """Downloads the sheet if it changed, and only then re-cleans it into a new snapshot."""
+    previous = snapshot_path(file_digest(filename)) if os.path.exists(filename) else None
+    changed = download_public_sheet_as_csv(csv_url, filename, client=client)
+    if changed:
+        report_unmapped_values(build_snapshot(filename), previous)
+    return changed
+
+
+def report_unmapped_values(path: Path, previous: Path | None) -> dict:
+    """Logs and saves (to TAXONOMY_REPORT) the values new in a snapshot that the taxonomy does not know.
 
-    with open(filename, "wb") as f:
-        f.write(response.content)
+    Args:
+        path (Path): The new snapshot
+        previous (Path, optional): The snapshot it replaces, nothing is reported without it.
+    Returns:
+        dict: The new values of each column having some
+    """
+    if previous is None or not previous.exists():
+        return {}
+
+    taxonomy = load_taxonomy()
+    report = unmapped_values(load_values(path), load_values(previous), taxonomy)
+    for column, values in report.items():
+        logger.warning(
+            "%d new values of %s are not in the taxonomy (version %s): %s",
+            len(values),
+            column,
+            taxonomy.version,
+            ", ".join(values),
+        )
 
+    TAXONOMY_REPORT.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = temporary_path(TAXONOMY_REPORT)
+    tmp_path.write_text(
+        json.dumps(
+            {
+                "snapshot": path.stem,
+                "previous": previous.stem,
+                "taxonomy_version": taxonomy.version,
+                "created_at": time.time(),
+                "unmapped": report,
+            },
+            indent=2,
+        )
+    )
+    os.replace(tmp_path, TAXONOMY_REPORT)
+    return report
+
+
+def _refresh_forever(csv_url, filename, interval, client):
+    # started right after the first (blocking) download, see `update_repository_data`
+    while True:
+        time.sleep(interval)
+        try:
+            if refresh_repository_data(csv_url, filename, client):
+                logger.info("New version of the repository downloaded.")
+        except requests.exceptions.RequestException as e:
+            logger.warning("The online repository could not be downloaded: %s", e)
+        except Exception:
+            # e.g. a change in the sheet format, the thread must survive it
+            logger.exception("The online repository could not be refreshed.")
+
+
+@st.cache_resource(show_spinner=False)
+def start_background_refresh(
+    csv_url, filename="downloaded_sheet.csv", interval=TTL
+) -> threading.Thread:
+    """Starts (once per process) the thread keeping the downloaded sheet up to date."""
+    thread = threading.Thread(
+        target=_refresh_forever,
+        # the client is looked up here, the thread has no script context
+        args=(csv_url, filename, interval, get_fetch_client()),
+        name="aiie-repository-refresh",
+        daemon=True,
+    )
+    thread.start()
+    return thread
 
-@st.cache_data(show_spinner="Fetching more information about the incident...")
-def scrap_incident_description(link):
-    soup = BeautifulSoup(requests.get(link).text, "html.parser")
 
-    # This is dangeriously hard-coded.
-    description = soup.find_all(
-        class_="hJDwNd-AhqUyc-uQSCkd Ft7HRd-AhqUyc-uQSCkd jXK9ad D2fZ2 zu5uec OjCsFc dmUFtb wHaque g5GTcb"
-    )[1].get_text()
-    return description
+def normalize_column(df: pd.DataFrame, col) -> Values:
+    """The normalized values of a column of the sheet, split on its separator, with its synonyms merged."""
+    separator = SEMICOLON_SEPARATOR if col in SEMICOLON_SEPARATED else VALUES_SEPARATOR
+    return normalize(df[col], SYNONYMS.get(col), separator)
 
 
+@traced
 def clean_data(df: pd.DataFrame) -> pd.DataFrame:
     # remove the extra unused columns
     cols_to_drop = [name for name in df.columns if name.startswith("Unnamed:")]
@@ -137,15 +335,174 @@ def clean_data(df: pd.DataFrame) -> pd.DataFrame:
     # for col in str_columns:
     #     df[col] = df[col].astype("string").fillna("Unknown")
 
+    # the display strings are kept as is, the filters and the plots
+    # work on their normalized values (split, trimmed, case-folded, synonyms merged)
+    for col in MULTI_VALUED_COLUMNS:
+        values = to_arrow(normalize_column(df, col), len(df))
+        df[VALUES_PREFIX + col] = values.set_axis(df.index)
+
     return df
 
 
-def get_clean_data(file_path="repository.csv"):
-    # df = read_gsheet(AIAAIC_SHEET_ID, AIAAIC_SHEET_NAME)
-    df = get_repository_data().dropna(how="all")
+def file_digest(filename) -> str:
+    """Returns a short content hash of a file, memoized on its size and mtime."""
+    stat = os.stat(filename)
+    return _file_digest(os.fspath(filename), stat.st_size, stat.st_mtime_ns)
+
+
+@lru_cache(maxsize=8)
+def _file_digest(filename, size, mtime_ns):
+    with open(filename, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()[:16]
+
+
+def temporary_path(path) -> Path:
+    """A sibling path to write to before an atomic `os.replace`, unique per process and thread."""
+    path = Path(path)
+    return path.with_name(f"{path.name}.{os.getpid()}-{threading.get_ident()}.tmp")
+
+
+def snapshot_path(digest: str) -> Path:
+    # the normalization depends on the taxonomy too
+    taxonomy = load_taxonomy().digest
+    return SNAPSHOT_DIR / f"repository-v{SNAPSHOT_VERSION}-{taxonomy}-{digest}.feather"
+
+
+def build_snapshot(filename="downloaded_sheet.csv") -> Path:
+    """Parses and cleans the downloaded CSV once and saves the result as a Feather file.
+
+    The snapshot is keyed by the hash of the CSV content,
+    so it is only rebuilt when the sheet actually changed.
+
+    Args:
+        filename (str, optional): The downloaded CSV file. Defaults to "downloaded_sheet.csv".
 
-    columns_to_keep = list(map(str, C))
-    df = clean_data(df)[columns_to_keep]
+    Returns:
+        Path: The path of the (possibly already existing) snapshot.
+    """
+    path = snapshot_path(file_digest(filename))
+    if path.exists():
+        return path
+
+    values_columns = [VALUES_PREFIX + col for col in MULTI_VALUED_COLUMNS]
+    df = clean_data(read_repository_csv(filename).dropna(how="all"))
+    df = df[list(map(str, C)) + values_columns]
+
+    # the Arrow columns are added after the conversion,
+    # the pandas metadata only describes the display columns
+    table = pa.Table.from_pandas(df.drop(columns=values_columns).reset_index())
+    for name in values_columns:
+        table = table.append_column(name, pa.array(df[name].array))
+
+    # write to a temporary file first, the concurrent sessions
+    # should never see a half-written snapshot
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = temporary_path(path)
+    # uncompressed, otherwise the file cannot be memory-mapped
+    feather.write_feather(table, tmp_path, compression="uncompressed")
+    os.replace(tmp_path, path)
+
+    return path
+
+
+def load_snapshot(path: Path) -> pd.DataFrame:
+    """The display columns of a snapshot."""
+    table = feather.read_table(path, memory_map=True)
+    columns = [name for name in table.column_names if not name.startswith(VALUES_PREFIX)]
+    df = table.select(columns).to_pandas()
+    return df.set_index(df.columns[0])
+
+
+def load_values(path: Path) -> dict[str, Values]:
+    """The normalized values of the multi-valued columns of a snapshot, by column."""
+    table = feather.read_table(path, memory_map=True)
+    return {
+        name.removeprefix(VALUES_PREFIX): from_arrow(table[name])
+        for name in table.column_names
+        if name.startswith(VALUES_PREFIX)
+    }
+
+
+class Dataset:
+    """The cleaned repository, loaded once per process and shared (read-only) by all the sessions."""
+
+    def __init__(self, version: str, df: pd.DataFrame, values: dict | None = None):
+        self.version = version
+        self.df = df
+        self._values = dict(values or {})
+        self._multi_hot = {}
+
+    def __len__(self):
+        return len(self.df)
+
+    # The derived structures below are built lazily, once per version of the dataset.
+
+    @cached_property
+    def search_index(self) -> TrigramIndex:
+        return TrigramIndex(self.df)
+
+    @cached_property
+    def facets(self) -> FacetEngine:
+        return FacetEngine(self.df.index, self.values)
+
+    def values(self, col, index: pd.Index | None = None) -> Values:
+        """The normalized values of a column, as integer codes.
+
+        The multi-valued columns are normalized at ingest, the others on the first call.
+
+        Args:
+            col (str): The column
+            index (pd.Index, optional): Only the values of these rows (renumbered in this order)
+        Raises:
+            KeyError: Some of the rows are not in the dataset
+        """
+        if col not in self._values:
+            self._values[col] = normalize_column(self.df, col)
+        if index is None:
+            return self._values[col]
+
+        positions = self.df.index.get_indexer(index)
+        if (positions < 0).any():
+            raise KeyError("Some of the rows are not in the dataset")
+        return take(self._values[col], positions, len(self.df))
+
+    def multi_hot(self, col) -> MultiHot:
+        """The multi-hot encoding of a multi-valued column (with its synonyms merged)."""
+        if col not in self._multi_hot:
+            self._multi_hot[col] = multi_hot(self.values(col), len(self.df))
+        return self._multi_hot[col]
+
+
+def open_dataset(path: Path) -> Dataset:
+    # the snapshot name already carries the version (format + content hash)
+    return Dataset(path.stem, load_snapshot(path), load_values(path))
+
+
+@st.cache_resource(max_entries=2, show_spinner="Loading the repository...")
+def load_dataset(path: str) -> Dataset:
+    return open_dataset(Path(path))
+
+
+@traced
+def get_dataset(filename="downloaded_sheet.csv") -> Dataset:
+    update_repository_data(filename)
+
+    # the parsing and cleaning only happen once per version of the sheet
+    # and the loading once per process
+    dataset = load_dataset(str(build_snapshot(filename)))
+
+    # the sessions only keep track of the version they are looking at
+    if st.session_state.get("dataset_version") != dataset.version:
+        st.session_state["dataset_version"] = dataset.version
+        st.session_state.pop("mask", None)
+
+    return dataset
+
+
+@traced
+def get_clean_data(filename="downloaded_sheet.csv"):
+    # df = read_gsheet(AIAAIC_SHEET_ID, AIAAIC_SHEET_NAME)
+    dataset = get_dataset(filename)
 
     # remove hidden columns
     # df = df.drop(
@@ -163,10 +520,21 @@ def get_clean_data(file_path="repository.csv"):
     #     "aiie/pages/processed_dataset.csv", index=False
     # )  # Save to the correct directory
 
-    st.session_state["data"] = df
-    st.session_state["columns"] = C
+    # a shallow copy: no data is copied (thanks to copy-on-write)
+    # but adding columns to it leaves the shared dataframe untouched
+    return dataset.df.copy(deep=False), C
+
+
+def get_session_mask(size: int) -> np.ndarray:
+    """Returns the filter mask of the current session (all True by default)."""
+    if "mask" not in st.session_state:
+        return np.ones(size, dtype=bool)
+    # stored as a bitset, 8 times smaller than a bool array
+    return np.unpackbits(st.session_state["mask"], count=size).astype(bool)
+
 
-    return df, C
+def set_session_mask(mask: np.ndarray):
+    st.session_state["mask"] = np.packbits(np.asarray(mask, dtype=bool))
 
 
 def prepare_topic_analysis(df, description):
@@ -0,0 +1,239 @@
+import argparse
+import dbm
+import json
+import logging
+import os
+import shelve
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import pandas as pd
+import streamlit as st
+from data import CACHE_DIR
+
+DESCRIPTIONS_DB = Path(
+    os.environ.get("AIIE_DESCRIPTIONS_DB", CACHE_DIR / "descriptions.sqlite")
+)
+
+# The shelve database of the descriptions scraped before the store (description.db)
+LEGACY_SHELVE = "description"
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS descriptions (
+    id TEXT PRIMARY KEY,    -- the AIAAIC ID# of the incident
+    url TEXT,               -- the page it was scraped from
+    description TEXT NOT NULL,
+    links TEXT,             -- the JSON list of the links of the page
+    fetched_at REAL,
+    etag TEXT,              -- the validators of the page, for the conditional requests
+    last_modified TEXT
+);
+
+-- full-text index over the descriptions, kept in sync by the triggers below
+CREATE VIRTUAL TABLE IF NOT EXISTS descriptions_fts USING fts5(
+    description, content='descriptions', content_rowid='rowid'
+);
+
+CREATE TRIGGER IF NOT EXISTS descriptions_ai AFTER INSERT ON descriptions BEGIN
+    INSERT INTO descriptions_fts(rowid, description) VALUES (new.rowid, new.description);
+END;
+CREATE TRIGGER IF NOT EXISTS descriptions_ad AFTER DELETE ON descriptions BEGIN
+    INSERT INTO descriptions_fts(descriptions_fts, rowid, description)
+    VALUES ('delete', old.rowid, old.description);
+END;
+CREATE TRIGGER IF NOT EXISTS descriptions_au AFTER UPDATE ON descriptions BEGIN
+    INSERT INTO descriptions_fts(descriptions_fts, rowid, description)
+    VALUES ('delete', old.rowid, old.description);
+    INSERT INTO descriptions_fts(rowid, description) VALUES (new.rowid, new.description);
+END;
+"""
+
+
+class SQLiteStore:
+    """A SQLite database in WAL mode, shared by threads and processes.
+
+    The readers never block each other nor the writer.
+    Every thread gets its own connection.
+
+    Args:
+        path (Path): The database file
+        schema (str): The script creating the tables (if they do not exist)
+    """
+
+    def __init__(self, path, schema: str):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        with self.connection() as connection:
+            connection.executescript(schema)
+
+    def connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+
+class DescriptionStore(SQLiteStore):
+    """The scraped descriptions of the incidents, in SQLite, with a full-text (FTS5) index.
+
+    The readers (the sessions, the worker processes) never block
+    each other nor the writer (the crawler).
+
+    Args:
+        path (Path, optional): The database file. Defaults to DESCRIPTIONS_DB.
+    """
+
+    def __init__(self, path=DESCRIPTIONS_DB):
+        super().__init__(path, SCHEMA)
+        with self.connection() as connection:
+            # the databases created before the validators were added
+            columns = {row[1] for row in connection.execute("PRAGMA table_info(descriptions)")}
+            for column in ["etag", "last_modified"]:
+                if column not in columns:
+                    connection.execute(f"ALTER TABLE descriptions ADD COLUMN {column} TEXT")
+
+    def __len__(self):
+        return self.connection().execute("SELECT COUNT(*) FROM descriptions").fetchone()[0]
+
+    def get(self, ids) -> pd.Series:
+        """Looks the descriptions of some incidents up, in a single query.
+
+        Args:
+            ids (list-like): The ids of the incidents (e.g. the index of the masked rows)
+        Returns:
+            pd.Series: The descriptions found, indexed by id
+        """
+        rows = self.connection().execute(
+            "SELECT id, description FROM descriptions"
+            " WHERE id IN (SELECT value FROM json_each(?))",
+            (json.dumps(list(map(str, ids))),),
+        )
+        return pd.Series(dict(rows.fetchall()), dtype=object, name="Description")
+
+    def get_links(self, incident_id: str) -> list[str] | None:
+        row = self.connection().execute(
+            "SELECT links FROM descriptions WHERE id = ?", (incident_id,)
+        ).fetchone()
+        return None if row is None or row[0] is None else json.loads(row[0])
+
+    def validators(self, ids) -> dict[str, tuple]:
+        """The (url, etag, last_modified) the descriptions of some incidents were fetched with."""
+        rows = self.connection().execute(
+            "SELECT id, url, etag, last_modified FROM descriptions"
+            " WHERE id IN (SELECT value FROM json_each(?))",
+            (json.dumps(list(map(str, ids))),),
+        )
+        return {incident_id: tuple(validators) for incident_id, *validators in rows}
+
+    def put_many(self, rows):
+        """Inserts or replaces descriptions.
+
+        Args:
+            rows (iterable): (id, url, description, links, etag, last_modified) tuples,
+                the links are a list, any of them but the id and the description can be None
+        """
+        now = time.time()
+        with self.connection() as connection:
+            connection.executemany(
+                "INSERT INTO descriptions"
+                " (id, url, description, links, fetched_at, etag, last_modified)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (id) DO UPDATE SET url = excluded.url,"
+                " description = excluded.description, links = excluded.links,"
+                " fetched_at = excluded.fetched_at, etag = excluded.etag,"
+                " last_modified = excluded.last_modified",
+                (
+                    (
+                        str(incident_id),
+                        url,
+                        description,
+                        None if links is None else json.dumps(links),
+                        now,
+                        etag,
+                        last_modified,
+                    )
+                    for incident_id, url, description, links, etag, last_modified in rows
+                ),
+            )
+
+    def touch(self, ids):
+        """Marks descriptions as fetched now (their page has not changed)."""
+        with self.connection() as connection:
+            connection.execute(
+                "UPDATE descriptions SET fetched_at = ?"
+                " WHERE id IN (SELECT value FROM json_each(?))",
+                (time.time(), json.dumps(list(map(str, ids)))),
+            )
+
+    def search(self, keyword: str) -> pd.Index:
+        """The ids of the incidents whose description has a word starting with the keyword.
+
+        Args:
+            keyword (str): Searched as a phrase (its words in this order), case-insensitive
+        Returns:
+            pd.Index: The matching ids
+        """
+        # quoted, the keyword is never parsed as an FTS5 query (AND, OR, NEAR, ...)
+        query = '"' + keyword.replace('"', '""') + '"*'
+        rows = self.connection().execute(
+            "SELECT descriptions.id FROM descriptions_fts"
+            " JOIN descriptions ON descriptions.rowid = descriptions_fts.rowid"
+            " WHERE descriptions_fts MATCH ?",
+            (query,),
+        )
+        return pd.Index([incident_id for (incident_id,) in rows], dtype=object)
+
+
+@st.cache_resource
+def get_description_store() -> DescriptionStore:
+    store = DescriptionStore()
+    # the former descriptions are migrated once, when the store is created
+    # (the shelve can only be read with the dbm module that wrote it)
+    if not len(store) and dbm.whichdb(LEGACY_SHELVE):
+        logger.info(
+            "%d descriptions migrated from the %s shelve",
+            migrate_shelve(LEGACY_SHELVE, store),
+            LEGACY_SHELVE,
+        )
+    return store
+
+
+def migrate_shelve(filename: str, store: DescriptionStore) -> int:
+    """Copies the descriptions of the former shelve database (e.g. description.db) to the store.
+
+    Opening the shelve requires the dbm module that created it.
+
+    Returns:
+        int: The number of descriptions copied
+    """
+    with shelve.open(filename, "r") as db:
+        rows = [
+            (incident_id, None, str(db[incident_id]), None, None, None)
+            for incident_id in db
+        ]
+    store.put_many(rows)
+    return len(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the incident descriptions store.")
+    parser.add_argument(
+        "--migrate",
+        metavar="SHELVE",
+        help='Import a shelve database (e.g. "description" for description.db).',
+    )
+    parser.add_argument("--db", default=DESCRIPTIONS_DB, help="The SQLite database.")
+    args = parser.parse_args()
+
+    store = DescriptionStore(args.db)
+    if args.migrate:
+        print(f"{migrate_shelve(args.migrate, store)} descriptions migrated to {args.db}")
+    print(f"{len(store)} descriptions in {args.db}")
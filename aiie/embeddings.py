@@ -0,0 +1,232 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+import pyarrow.feather as feather
+import scipy.sparse as sp
+import streamlit as st
+from data import CACHE_DIR, SNAPSHOT_DIR, C, Dataset, open_dataset, temporary_path
+from encoding import SYNONYMS
+from jobs import get_job_runner, job_result, report_progress
+
+EMBEDDING_DIR = CACHE_DIR / "umap"
+
+# The incidents are embedded on all these columns, the coloring only picks one of them
+FEATURE_COLUMNS = (C.technology, C.transparency, C.risks, C.sector)
+
+# Above this share of new (or changed) incidents, the model is refitted
+# instead of transforming them with the model of a previous version
+MAX_NEW_ROWS = 0.1
+
+logger = logging.getLogger(__name__)
+
+
+def feature_set_key(columns=FEATURE_COLUMNS) -> str:
+    """A short hash of the feature columns and of their synonyms."""
+    spec = [(str(col), SYNONYMS.get(col)) for col in columns]
+    return hashlib.sha1(json.dumps(spec, sort_keys=True).encode()).hexdigest()[:8]
+
+
+def embedding_paths(version: str, n_neighbors: int, columns=FEATURE_COLUMNS):
+    """The coordinates (Feather) and the model (joblib) files of an embedding."""
+    stem = f"{version}-{feature_set_key(columns)}-n{n_neighbors}"
+    return EMBEDDING_DIR / f"{stem}.feather", EMBEDDING_DIR / f"{stem}.joblib"
+
+
+def incident_features(
+    dataset: Dataset, columns=FEATURE_COLUMNS, vocabulary: pd.Index | None = None
+) -> tuple[pd.Index, sp.csr_matrix, pd.Index]:
+    """The multi-hot features of the incidents, the columns side by side.
+
+    Args:
+        dataset (Dataset): The dataset
+        columns (tuple, optional): The multi-valued columns. Defaults to FEATURE_COLUMNS.
+        vocabulary (pd.Index, optional): The features of an already fitted model,
+            the values it has never seen are dropped. Defaults to all the values.
+    Returns:
+        tuple: The ids of the incidents, their (incidents x features) matrix and the features
+    """
+    is_incident = (dataset.df[C.type] == "Incident").to_numpy()
+
+    matrices, features = [], []
+    for col in columns:
+        encoding = dataset.multi_hot(col)
+        matrices.append(encoding.matrix[is_incident])
+        features += [f"{col}: {value}" for value in encoding.vocabulary]
+    matrix, features = sp.hstack(matrices, format="csr"), pd.Index(features)
+
+    if vocabulary is not None:
+        # move the known features to the position the model expects
+        positions = vocabulary.get_indexer(features)
+        known = np.flatnonzero(positions >= 0)
+        projection = sp.csr_matrix(
+            (np.ones(known.size), (known, positions[known])),
+            shape=(len(features), len(vocabulary)),
+        )
+        matrix, features = (matrix @ projection).tocsr(), vocabulary
+
+    return dataset.df.index[is_incident], matrix, features
+
+
+def row_signatures(matrix: sp.csr_matrix, features: pd.Index) -> np.ndarray:
+    """A hash of the features of each row, to notice the incidents edited in a new version."""
+    rows = np.split(matrix.indices, matrix.indptr[1:-1])
+    return pd.util.hash_array(
+        np.array(["\x1f".join(sorted(features[row])) for row in rows], dtype=object)
+    )
+
+
+def fit_embedding(matrix: sp.csr_matrix, n_neighbors: int):
+    """Fits the scaler + UMAP model and returns it with the (rows x 2) coordinates."""
+    # imported here, in the worker: umap (numba) and sklearn take seconds to import
+    from sklearn.pipeline import make_pipeline
+    from sklearn.preprocessing import StandardScaler
+    from umap import UMAP
+
+    model = make_pipeline(
+        StandardScaler(),
+        UMAP(n_neighbors=n_neighbors, min_dist=0.1, n_components=2, random_state=42),
+    )
+    return model, model.fit_transform(matrix.toarray())
+
+
+def warm_up_umap() -> float:
+    """The job compiling UMAP on a tiny matrix, so that the first real fit does not.
+
+    The worker keeps the compiled code, and numba caches it on disk for the other processes.
+
+    Returns:
+        float: Its duration, in seconds
+    """
+    start = time.perf_counter()
+    rng = np.random.default_rng(42)
+    matrix = sp.csr_matrix((rng.random((64, 16)) < 0.2).astype(float))
+    model, _ = fit_embedding(matrix, n_neighbors=5)
+    # the incremental updates go through `transform`
+    model.transform(matrix[:8].toarray())
+
+    elapsed = time.perf_counter() - start
+    logger.info("UMAP warmed up in %.1fs", elapsed)
+    return elapsed
+
+
+def submit_umap_warmup():
+    """Warms a job worker up for UMAP, in the background (see `warm_up_umap`)."""
+    return get_job_runner().submit("umap-warmup", warm_up_umap)
+
+
+def previous_embedding(version: str, n_neighbors: int, columns=FEATURE_COLUMNS):
+    """The most recent embedding of another version with the same features and neighbors."""
+    pattern = f"*-{feature_set_key(columns)}-n{n_neighbors}.feather"
+    candidates = [
+        path
+        for path in EMBEDDING_DIR.glob(pattern)
+        if not path.name.startswith(version + "-") and path.with_suffix(".joblib").exists()
+    ]
+    return max(candidates, key=lambda path: path.stat().st_mtime, default=None)
+
+
+def save_embedding(coordinates: pd.DataFrame, artifact: dict, paths):
+    coordinates_path, model_path = paths
+    coordinates_path.parent.mkdir(parents=True, exist_ok=True)
+
+    # the model first: an embedding is only looked up once its coordinates exist
+    tmp_path = temporary_path(model_path)
+    joblib.dump(artifact, tmp_path)
+    os.replace(tmp_path, model_path)
+
+    tmp_path = temporary_path(coordinates_path)
+    feather.write_feather(
+        coordinates.rename_axis("id").reset_index(), tmp_path, compression="uncompressed"
+    )
+    os.replace(tmp_path, coordinates_path)
+
+
+def build_embedding(dataset: Dataset, n_neighbors: int) -> str:
+    """Embeds the incidents in 2D with UMAP, once per (version, feature set, n_neighbors).
+
+    The coordinates and the fitted model are persisted to the cache directory.
+    For a new version of the sheet, the model of the previous version is reused when
+    few incidents were added or edited: the others keep their coordinates
+    and the new ones are `transform`ed into the same space.
+
+    Args:
+        dataset (Dataset): The dataset
+        n_neighbors (int): The size of the UMAP neighborhoods
+    Returns:
+        str: The path of the coordinates (Feather file)
+    """
+    paths = embedding_paths(dataset.version, n_neighbors)
+    if paths[0].exists():
+        return str(paths[0])
+
+    ids, matrix, features = incident_features(dataset)
+    signatures = row_signatures(matrix, features)
+
+    previous_path = previous_embedding(dataset.version, n_neighbors)
+    if previous_path is not None:
+        previous = load_embedding(str(previous_path))
+        # (no NaN for the missing ids, the hashes do not survive a cast to float)
+        new = previous["signature"].reindex(ids, fill_value=0).to_numpy() != signatures
+        if new.sum() <= MAX_NEW_ROWS * len(ids):
+            artifact = joblib.load(previous_path.with_suffix(".joblib"))
+            coordinates = previous.reindex(ids)
+            coordinates["signature"] = signatures
+            if new.any():
+                report_progress(0.5, f"Transforming {new.sum()} new incidents")
+                _, new_matrix, _ = incident_features(
+                    dataset, vocabulary=artifact["vocabulary"]
+                )
+                coordinates.loc[new, ["UMAP-1", "UMAP-2"]] = artifact["model"].transform(
+                    new_matrix[new].toarray()
+                )
+            logger.info(
+                "UMAP: %d incidents transformed with the model of %s",
+                new.sum(),
+                previous_path.name,
+            )
+            save_embedding(coordinates, artifact, paths)
+            return str(paths[0])
+
+    report_progress(0.2, "Fitting UMAP")
+    model, embedding = fit_embedding(matrix, n_neighbors)
+    coordinates = pd.DataFrame(embedding, index=ids, columns=["UMAP-1", "UMAP-2"])
+    coordinates["signature"] = signatures
+    save_embedding(coordinates, {"model": model, "vocabulary": features}, paths)
+    return str(paths[0])
+
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+def load_embedding(path: str) -> pd.DataFrame:
+    """The (incidents x [UMAP-1, UMAP-2, signature]) coordinates, indexed by id."""
+    return feather.read_feather(path).set_index("id")
+
+
+def embed_snapshot(path: str, n_neighbors: int) -> str:
+    """The job building an embedding in a worker process, from the snapshot of the dataset."""
+    report_progress(0.1, "Loading the dataset")
+    return build_embedding(open_dataset(Path(path)), n_neighbors)
+
+
+def get_embedding(dataset: Dataset, n_neighbors: int) -> pd.DataFrame | None:
+    """The embedding of the incidents, or None while it is being built in the background.
+
+    Meanwhile, a progress bar is shown and the page reruns by itself once it is ready.
+    """
+    path = embedding_paths(dataset.version, n_neighbors)[0]
+    if not path.exists():
+        # the version is the name of the snapshot (see `load_dataset`)
+        snapshot = SNAPSHOT_DIR / f"{dataset.version}.feather"
+        job = get_job_runner().submit(
+            f"umap-{path.stem}", embed_snapshot, str(snapshot), n_neighbors
+        )
+        if job_result(job, "Embedding the incidents...") is None:
+            return None
+
+    return load_embedding(str(path))
@@ -0,0 +1,125 @@
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from facets import VALUES_SEPARATOR, split_values
+from scipy.sparse import csr_matrix
+from taxonomy import load_taxonomy
+
+# The synonyms merged together, by column name (see taxonomy.toml)
+SYNONYMS = load_taxonomy().synonyms
+
+# The normalized values of a multi-valued column, one (row, value) pair per entry:
+# the positions of the rows (sorted), the codes of the values and the (sorted) values
+Values = namedtuple("Values", ["rows", "codes", "vocabulary"])
+
+MultiHot = namedtuple("MultiHot", ["matrix", "vocabulary"])
+
+
+def normalize(
+    series: pd.Series, synonyms: dict | None = None, separator: str = VALUES_SEPARATOR
+) -> Values:
+    """Splits a multi-valued column into trimmed values, merged case-insensitively and with their synonyms.
+
+    A merged value is named after its most frequent spelling (e.g. "USA" for "usa" and "USA"),
+    or after the merged name of its synonyms.
+
+    Args:
+        series (pd.Series): The column, with semicolon or comma-separated values
+        synonyms (dict, optional): Lookup of the (case-folded) values to merge together
+        separator (str, optional): See `split_values`
+    Returns:
+        Values: The codes of the values of every row, a value appears once per row
+    """
+    values = split_values(series, separator)
+    keys = values.str.casefold()
+    if synonyms:
+        # looked up once per distinct value
+        codes, uniques = pd.factorize(keys)
+        merged = pd.Series(uniques).map(synonyms).fillna(pd.Series(uniques))
+        keys = pd.Series(merged.to_numpy()[codes], index=keys.index)
+
+    spellings = values.where(keys == values.str.casefold(), keys)
+    names = (
+        pd.DataFrame({"key": keys, "name": spellings})
+        .value_counts(sort=True)
+        .reset_index()
+        .drop_duplicates("key")
+        .set_index("key")["name"]
+    )
+
+    codes, vocabulary = pd.factorize(keys.map(names), sort=True)
+    # two synonyms in the same cell are counted once
+    pairs = pd.DataFrame({"row": values.index.to_numpy(), "code": codes}).drop_duplicates()
+    return Values(
+        pairs["row"].to_numpy(np.int64),
+        pairs["code"].to_numpy(np.int32),
+        vocabulary.to_numpy(dtype=object),
+    )
+
+
+def to_arrow(values: Values, size: int) -> pd.Series:
+    """Stores the values as an Arrow list<dictionary<int32, string>> column of `size` rows."""
+    offsets = np.searchsorted(values.rows, np.arange(size + 1)).astype(np.int32)
+    dictionary = pa.DictionaryArray.from_arrays(
+        pa.array(values.codes, pa.int32()), pa.array(values.vocabulary, pa.string())
+    )
+    return pd.Series(
+        pd.arrays.ArrowExtensionArray(pa.ListArray.from_arrays(offsets, dictionary))
+    )
+
+
+def from_arrow(array: pa.ChunkedArray) -> Values:
+    """The reverse of `to_arrow`, without any string processing."""
+    array = array.unify_dictionaries().combine_chunks()
+    entries = array.flatten()
+    return Values(
+        array.value_parent_indices().to_numpy().astype(np.int64),
+        entries.indices.to_numpy().astype(np.int32),
+        entries.dictionary.to_numpy(zero_copy_only=False),
+    )
+
+
+def take(values: Values, positions: np.ndarray, size: int) -> Values:
+    """The values of some rows, renumbered in their order.
+
+    Args:
+        values (Values): The values of all the rows
+        positions (np.ndarray): The positions of the rows to keep (all of them valid)
+        size (int): The number of rows of `values`
+    """
+    lookup = np.full(size, -1, dtype=np.int64)
+    lookup[positions] = np.arange(len(positions))
+    rows = lookup[values.rows]
+    kept = np.flatnonzero(rows >= 0)
+    kept = kept[np.argsort(rows[kept], kind="stable")]
+    return Values(rows[kept], values.codes[kept], values.vocabulary)
+
+
+def multi_hot(values: Values, size: int) -> MultiHot:
+    """Encodes normalized values as a sparse (rows x values) matrix of 0/1.
+
+    Args:
+        values (Values): The values of a multi-valued column (see `normalize`)
+        size (int): The number of rows
+    Returns:
+        MultiHot: The CSR matrix and the (sorted) values of its columns
+    """
+    matrix = csr_matrix(
+        (np.ones(len(values.codes), dtype=np.int32), (values.rows, values.codes)),
+        shape=(size, len(values.vocabulary)),
+    )
+    return MultiHot(matrix, values.vocabulary)
+
+
+def joined_values(encoding: MultiHot) -> np.ndarray:
+    """The comma-joined values of each row (the reverse of the encoding)."""
+    indptr, indices = encoding.matrix.indptr, encoding.matrix.indices
+    return np.array(
+        [
+            ", ".join(encoding.vocabulary[indices[start:stop]])
+            for start, stop in zip(indptr[:-1], indptr[1:])
+        ],
+        dtype=object,
+    )
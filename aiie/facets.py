@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+
+# The multi-valued cells are semicolon or comma-separated
+# (clean_data already swaps some of the semicolons for commas).
+VALUES_SEPARATOR = r"\s*[;,]\s*"
+
+# For the columns whose values may contain commas
+SEMICOLON_SEPARATOR = r"\s*;\s*"
+
+
+def split_values(series: pd.Series, separator: str = VALUES_SEPARATOR) -> pd.Series:
+    """Splits the multi-valued cells of a column, one value per row.
+
+    Args:
+        series (pd.Series): The column
+        separator (str, optional): The regex between the values. Defaults to VALUES_SEPARATOR.
+    Returns:
+        pd.Series: The trimmed, non-empty values, indexed by the position of their row.
+    """
+    values = (
+        series.reset_index(drop=True)
+        .dropna()
+        .astype(str)
+        .str.split(separator)
+        .explode()
+        .str.strip()
+    )
+    return values[values != ""]
+
+
+def to_bitset(mask: np.ndarray, n_words: int) -> np.ndarray:
+    """Packs a boolean mask into 64-bit words (bit i of the bitset is row i)."""
+    packed = np.zeros(n_words * 8, dtype=np.uint8)
+    bits = np.packbits(np.asarray(mask, dtype=bool), bitorder="little")
+    packed[: bits.size] = bits
+    return packed.view("<u8")
+
+
+def from_bitset(bitset: np.ndarray, size: int) -> np.ndarray:
+    return np.unpackbits(bitset.view(np.uint8), count=size, bitorder="little").astype(
+        bool
+    )
+
+
+class Facet:
+    """The values of a (multi-valued) column, each with the bitset of the rows having it.
+
+    Args:
+        values (Values): The normalized values of the column (see `encoding.normalize`)
+        n_words (int): The size of the bitsets
+    """
+
+    def __init__(self, values, n_words: int):
+        rows, codes = values.rows, values.codes
+        self.values = pd.Index(values.vocabulary)
+        self.bitsets = np.zeros((len(self.values), n_words), dtype=np.uint64)
+        np.bitwise_or.at(
+            self.bitsets,
+            (codes, rows // 64),
+            np.left_shift(np.uint64(1), (rows % 64).astype(np.uint64)),
+        )
+
+    def counts(self, bitset: np.ndarray) -> pd.Series:
+        """Returns the number of rows of the bitset having each value."""
+        return pd.Series(
+            np.bitwise_count(self.bitsets & bitset).sum(axis=1), index=self.values
+        )
+
+    def any_of(self, values) -> np.ndarray:
+        """Returns the bitset of the rows having at least one of the values."""
+        codes = self.values.get_indexer(values)
+        return np.bitwise_or.reduce(self.bitsets[codes[codes >= 0]], axis=0)
+
+
+class FacetEngine:
+    """Facets of the columns of a dataframe, built lazily (one column at a time).
+
+    The filtering and the counting are done on bitsets:
+    a bitwise AND followed by a popcount.
+
+    Args:
+        index (pd.Index): The rows
+        values (callable): Returns the normalized values of a column, as integer codes
+    """
+
+    def __init__(self, index: pd.Index, values):
+        self.index = index
+        self.values = values
+        self.size = len(index)
+        self.n_words = (self.size + 63) // 64
+        self._facets = {}
+
+    def facet(self, col) -> Facet:
+        if col not in self._facets:
+            self._facets[col] = Facet(self.values(col), self.n_words)
+        return self._facets[col]
+
+    def counts(self, col, mask: np.ndarray) -> pd.Series:
+        """Returns the count of each value of a column within the masked rows."""
+        return self.facet(col).counts(to_bitset(mask, self.n_words))
+
+    def mask(self, col, values) -> np.ndarray:
+        """Returns the mask of the rows having at least one of the values in a column."""
+        if not len(values):
+            return np.zeros(self.size, dtype=bool)
+        return from_bitset(self.facet(col).any_of(values), self.size)
@@ -0,0 +1,181 @@
+import logging
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+
+# The statuses worth retrying (the server is busy or temporarily failing)
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# In seconds: connecting to a host that is up is fast, reading a page can be slow
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 30
+
+# After that many failed requests in a row, a host is not requested anymore for a while
+BREAKER_THRESHOLD = 5
+BREAKER_COOLDOWN = 60
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """Raised instead of requesting a host that keeps failing.
+
+    It is a `requests.RequestException`:
+    the callers serve their cached content, as for any network failure.
+    """
+
+
+def retry_delay(
+    attempt: int, backoff: float, response=None, max_delay: float = READ_TIMEOUT
+) -> float:
+    """Exponential backoff with jitter, unless the server says how long to wait.
+
+    A Retry-After is only honoured up to `max_delay` (or the backoff, if longer):
+    a server asking for an hour would otherwise hold the thread (and the page) as long.
+    """
+    delay = backoff * 2**attempt
+    retry_after = response is not None and response.headers.get("Retry-After")
+    if retry_after and retry_after.isdigit():
+        return min(float(retry_after), max(delay, max_delay))
+    return delay * (0.5 + random.random())
+
+
+class CircuitBreaker:
+    """Counts the consecutive failures of each host.
+
+    Above the threshold, the circuit of the host opens: its requests fail right away.
+    After the cooldown, a single request is let through,
+    its success closes the circuit, its failure opens it again.
+
+    Args:
+        threshold (int, optional): Defaults to BREAKER_THRESHOLD.
+        cooldown (float, optional): In seconds. Defaults to BREAKER_COOLDOWN.
+    """
+
+    def __init__(self, threshold: int = BREAKER_THRESHOLD, cooldown: float = BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.lock = threading.Lock()
+        self.failures = {}
+        self.opened_at = {}
+
+    def allow(self, host: str) -> bool:
+        with self.lock:
+            opened_at = self.opened_at.get(host)
+            if opened_at is None:
+                return True
+            if time.monotonic() - opened_at < self.cooldown:
+                return False
+            # half-open: the others keep failing fast until this one is done
+            self.opened_at[host] = time.monotonic()
+            return True
+
+    def success(self, host: str):
+        with self.lock:
+            self.failures.pop(host, None)
+            if self.opened_at.pop(host, None) is not None:
+                logger.info("%s is back, closing its circuit", host)
+
+    def failure(self, host: str):
+        with self.lock:
+            self.failures[host] = self.failures.get(host, 0) + 1
+            if self.failures[host] >= self.threshold:
+                if host not in self.opened_at:
+                    logger.warning(
+                        "%s failed %d times in a row, not requesting it for %ds",
+                        host,
+                        self.failures[host],
+                        self.cooldown,
+                    )
+                self.opened_at[host] = time.monotonic()
+
+
+class FetchClient:
+    """The HTTP client of all the outbound requests.
+
+    The connections are pooled (kept alive) and shared by the threads,
+    every request has a connect and a read timeout,
+    the transient failures are retried with a jittered exponential backoff,
+    and the hosts that keep failing are short-circuited (see `CircuitBreaker`).
+
+    Args:
+        pool_size (int, optional): The connections kept alive per host. Defaults to 10.
+        retries (int, optional): The number of retries. Defaults to 2.
+        backoff (float, optional): The base delay between the retries, in seconds. Defaults to 1.
+        timeout (tuple, optional): The connect and read timeouts, in seconds.
+        throttle (callable, optional): Called with the url before every attempt (e.g. a rate limiter).
+        breaker (CircuitBreaker, optional): Defaults to a new one.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = 10,
+        retries: int = 2,
+        backoff: float = 1.0,
+        timeout: tuple = (CONNECT_TIMEOUT, READ_TIMEOUT),
+        throttle=None,
+        breaker: CircuitBreaker | None = None,
+    ):
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.throttle = throttle
+        self.breaker = breaker or CircuitBreaker()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def get(self, url: str, headers: dict | None = None, timeout=None) -> requests.Response:
+        """GETs a url, retrying the transient failures.
+
+        Args:
+            url (str): The url
+            headers (dict, optional): e.g. the validators of a conditional request
+            timeout (float or tuple, optional): Overrides the timeouts of the client.
+        Raises:
+            CircuitOpenError: The host keeps failing, it was not requested.
+            requests.RequestException: The last failure, once the retries are exhausted.
+        Returns:
+            requests.Response: The last response (a 304 for a conditional request of an unchanged page)
+        """
+        host = urlsplit(url).netloc
+        if not self.breaker.allow(host):
+            raise CircuitOpenError(f"The circuit of {host} is open")
+        # no longer waiting for the server to be ready than for it to answer
+        timeout = timeout or self.timeout
+        max_delay = timeout[1] if isinstance(timeout, tuple) else timeout
+
+        for attempt in range(self.retries + 1):
+            if self.throttle is not None:
+                self.throttle(url)
+            try:
+                response = self.session.get(url, headers=headers, timeout=timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.retries:
+                    self.breaker.failure(host)
+                    raise
+                time.sleep(retry_delay(attempt, self.backoff))
+                continue
+
+            if response.status_code not in RETRY_STATUSES:
+                # the host answered, even an error (e.g. a 404) is not its failure
+                self.breaker.success(host)
+                response.raise_for_status()
+                return response
+            if attempt == self.retries:
+                self.breaker.failure(host)
+                response.raise_for_status()
+            time.sleep(retry_delay(attempt, self.backoff, response, max_delay))
+
+
+@st.cache_resource
+def get_fetch_client() -> FetchClient:
+    # one per server process, shared by all the sessions and the background threads
+    return FetchClient()
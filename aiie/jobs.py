@@ -0,0 +1,212 @@
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import types
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+
+import streamlit as st
+from data import CACHE_DIR, temporary_path
+
+JOBS_DIR = CACHE_DIR / "jobs"
+
+# numba writes the machine code of UMAP there, the next processes load it instead of compiling it
+NUMBA_CACHE_DIR = CACHE_DIR / "numba"
+
+# The finished jobs kept around for the sessions that have not picked their result up yet
+MAX_FINISHED_JOBS = 32
+
+logger = logging.getLogger(__name__)
+
+# Set in the worker processes, to the progress file of the running job
+_progress_path = None
+
+
+def report_progress(fraction: float, text: str = ""):
+    """Called from a job function to update its progress (does nothing outside of a job)."""
+    if _progress_path is None:
+        return
+    tmp_path = temporary_path(_progress_path)
+    tmp_path.write_text(json.dumps({"fraction": fraction, "text": text}))
+    os.replace(tmp_path, _progress_path)
+
+
+def _run(progress_path, func, args, kwargs):
+    # runs in a worker process
+    global _progress_path
+    _progress_path = progress_path
+    try:
+        return func(*args, **kwargs)
+    finally:
+        _progress_path = None
+
+
+@contextmanager
+def _hidden_main_module():
+    """Hides the main module from the worker processes started meanwhile.
+
+    A spawned worker re-imports the main module of its parent,
+    which is the Streamlit script itself (it would run the whole page).
+    """
+    main_module = sys.modules["__main__"]
+    sys.modules["__main__"] = types.ModuleType("__main__")
+    try:
+        yield
+    finally:
+        sys.modules["__main__"] = main_module
+
+
+def _log_failure(key: str, future: Future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.error("The job %s failed", key, exc_info=future.exception())
+
+
+class Job:
+    """A function running in the process pool, shared by all the sessions asking for it."""
+
+    def __init__(self, key: str, future: Future, progress_path):
+        self.key = key
+        self.future = future
+        self.progress_path = progress_path
+        self.started = time.monotonic()
+
+    def done(self) -> bool:
+        return self.future.done()
+
+    def failed(self) -> bool:
+        return self.future.done() and self.future.exception() is not None
+
+    def result(self):
+        """The return value of the function (or the exception it raised)."""
+        return self.future.result()
+
+    def progress(self) -> tuple[float, str]:
+        """The last progress reported by the function, with the elapsed time."""
+        elapsed = f"{time.monotonic() - self.started:.0f}s"
+        try:
+            progress = json.loads(self.progress_path.read_text())
+        except (OSError, ValueError):
+            return 0.0, elapsed
+        return progress["fraction"], f"{progress['text']} ({elapsed})".strip()
+
+
+class JobRunner:
+    """A local job queue backed by a process pool.
+
+    The heavy computations (model fitting) run outside of the script threads,
+    the pages submit them and pick their result up on a later rerun.
+    The jobs are identified by a key made of their parameters:
+    submitting a job already queued or running returns the existing one,
+    so the same computation is never done twice at once.
+
+    Args:
+        max_workers (int, optional): The size of the pool. Defaults to half the CPUs.
+    """
+
+    def __init__(self, max_workers: int | None = None):
+        self.max_workers = max_workers or max(1, (os.cpu_count() or 2) // 2)
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.pool = self._new_pool()
+        JOBS_DIR.mkdir(parents=True, exist_ok=True)
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        # the workers inherit the environment when they are spawned
+        os.environ.setdefault("NUMBA_CACHE_DIR", str(NUMBA_CACHE_DIR.resolve()))
+        # "spawn": forking the server process (and its threads) is not safe
+        return ProcessPoolExecutor(
+            self.max_workers, mp_context=multiprocessing.get_context("spawn")
+        )
+
+    def submit(self, key: str, func, *args, **kwargs) -> Job:
+        """Runs func(*args, **kwargs) in the pool, unless a job with the same key exists.
+
+        Args:
+            key (str): Identifies the job, it must cover all the parameters.
+            func (callable): A module-level function (it is pickled to the workers).
+        Returns:
+            Job: The new or the existing job.
+        """
+        with self.lock:
+            # a failed job is kept (and its error shown) until it is forgotten, see `job_result`
+            job = self.jobs.get(key)
+            if job is not None:
+                return job
+
+            progress_path = JOBS_DIR / f"{key}.progress"
+            progress_path.unlink(missing_ok=True)
+            # the workers are started on demand, by the submissions
+            with _hidden_main_module():
+                try:
+                    future = self.pool.submit(_run, progress_path, func, args, kwargs)
+                except BrokenProcessPool:
+                    # a worker died (e.g. out of memory), start over with a new pool
+                    logger.warning("The job pool is broken, restarting it")
+                    self.pool = self._new_pool()
+                    future = self.pool.submit(_run, progress_path, func, args, kwargs)
+
+            future.add_done_callback(lambda future: _log_failure(key, future))
+            self.jobs[key] = Job(key, future, progress_path)
+            self._forget_finished()
+            return self.jobs[key]
+
+    def forget(self, key: str):
+        """Drops a job, the next submission with its key runs it again."""
+        with self.lock:
+            job = self.jobs.pop(key, None)
+        if job is not None:
+            job.progress_path.unlink(missing_ok=True)
+
+    def _forget_finished(self):
+        finished = [key for key, job in self.jobs.items() if job.done()]
+        for key in finished[: max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            self.jobs.pop(key).progress_path.unlink(missing_ok=True)
+
+
+@st.cache_resource
+def get_job_runner() -> JobRunner:
+    # one pool per server process, shared by all the sessions
+    return JobRunner()
+
+
+def job_result(job: Job, label: str):
+    """Returns the result of a finished job.
+
+    While the job runs, shows its progress instead and returns None:
+    the page reruns by itself once the job is done.
+    If the job failed, shows its error with a button to run it again and returns None.
+
+    Args:
+        job (Job): The job
+        label (str): Describes the job in the progress bar
+    """
+    if job.failed():
+        _show_failure(job, label)
+        return None
+    if job.done():
+        return job.result()
+
+    _show_progress(job, label)
+    return None
+
+
+def _show_failure(job: Job, label: str):
+    error = job.future.exception()
+    st.error(f"{label.rstrip('.')} failed: {type(error).__name__}: {error}", icon="🚨")
+    if st.button("Retry", key=f"retry-{job.key}"):
+        get_job_runner().forget(job.key)
+        st.rerun()
+
+
+@st.fragment(run_every=1)
+def _show_progress(job: Job, label: str):
+    if job.done():
+        st.rerun()
+
+    fraction, text = job.progress()
+    st.progress(fraction, text=f"{label} {text}")
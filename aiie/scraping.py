@@ -0,0 +1,311 @@
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import html2text
+import requests
+import streamlit as st
+from bs4 import BeautifulSoup, SoupStrainer
+from data import CACHE_DIR
+from descriptions import SQLiteStore
+from fetch import FetchClient, get_fetch_client
+from markdownify import markdownify
+from tracing import traced
+
+PAGE_CACHE_DB = CACHE_DIR / "pages.sqlite"
+
+# After that, a cached page is revalidated (with a conditional request)
+TTL = 30 * 60 * 24
+
+# The cached descriptions and links above that size are evicted, least recently used first
+PAGE_CACHE_SIZE = int(os.environ.get("AIIE_PAGE_CACHE_SIZE", 64 * 1024 * 1024))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    html_hash TEXT,         -- the hash of the raw HTML, to skip the parsing when unchanged
+    description TEXT,       -- the parsed markdown
+    links TEXT,             -- the JSON list of the links of the page
+    etag TEXT,
+    last_modified TEXT,
+    fetched_at REAL,        -- the last time the page was fetched or revalidated
+    accessed_at REAL,       -- the last time it was read, for the eviction
+    size INTEGER            -- the size of the description and the links
+);
+CREATE INDEX IF NOT EXISTS pages_accessed_at ON pages (accessed_at);
+"""
+
+logger = logging.getLogger(__name__)
+
+# The number of pages prefetched at once
+MAX_PREFETCH_IN_FLIGHT = 4
+
+# The parsed content of a page
+CachedPage = namedtuple("CachedPage", ["description", "links", "fetched_at"])
+
+
+# This is dangeriously hard-coded.
+# DESCRIPTION_CLASS = "hJDwNd-AhqUyc-uQSCkd Ft7HRd-AhqUyc-uQSCkd purZT-AhqUyc-II5mzb ZcASvf-AhqUyc-II5mzb pSzOP-AhqUyc-qWD73c Ktthjf-AhqUyc-qWD73c JNdkSc SQVYQc"
+DESCRIPTION_CLASS = "hJDwNd-AhqUyc-uQSCkd Ft7HRd-AhqUyc-uQSCkd jXK9ad D2fZ2 zu5uec OjCsFc dmUFtb wHaque g5GTcb"
+
+# Only the description blocks are built into a tree, the rest of the page is skipped
+DESCRIPTION_STRAINER = SoupStrainer(class_=DESCRIPTION_CLASS)
+
+# The post-processing of the markdown, in one pass:
+# the heading it starts with, the site-relative links and the level 3 headings
+MARKDOWN_FIXES = re.compile(r"\A(#+)\s+|\]\(/aiaaic-repository|### ")
+
+# The text just before the list of the sources
+LINKS_SECTION = [re.compile(", commentar"), re.compile("act check 🚩")]
+UL_TAG = re.compile(r"<(/?)ul[\s>]", re.IGNORECASE)
+MARKDOWN_LINK = re.compile(r"\[([^][]*)\]\(([^()]*)\)")
+
+
+def _fix_markdown(match: re.Match) -> str:
+    if match.group(1) is not None:
+        # "#### " then made a level 3 heading... made "###### " in the end
+        return "###### "
+    if match.group(0) == "### ":
+        return "##### "
+    return "](https://www.aiaaic.org/aiaaic-repository"
+
+
+@traced
+def parse_incident_description(html: str) -> str:
+    """Extracts the description of an incident page, as markdown."""
+    soup = BeautifulSoup(html, "html.parser", parse_only=DESCRIPTION_STRAINER)
+    description = soup.find_all(class_=DESCRIPTION_CLASS)
+
+    description = markdownify("\n".join((str(i) for i in description[1:-1])))
+    return MARKDOWN_FIXES.sub(_fix_markdown, description)
+
+
+def _links_list(html: str) -> str | None:
+    """The HTML of the first list following the text of the sources section, if found as is."""
+    for pattern in LINKS_SECTION:
+        for match in pattern.finditer(html):
+            # in the text of the page, not in a tag (e.g. an attribute)
+            if html.rfind("<", 0, match.start()) > html.rfind(">", 0, match.start()):
+                continue
+
+            depth, start = 0, None
+            for tag in UL_TAG.finditer(html, match.end()):
+                if not tag.group(1):
+                    depth += 1
+                    start = tag.start() if start is None else start
+                elif start is not None:
+                    depth -= 1
+                    if depth == 0:
+                        return html[start : tag.end() + len("ul>")]
+            return None
+    return None
+
+
+@traced
+def parse_list_of_links(html: str) -> list[str]:
+    """Extracts the links of the sources listed on an incident page."""
+    section_list = _links_list(html)
+    if section_list is not None:
+        # only the list is parsed
+        li_list = BeautifulSoup(section_list, "html.parser").ul.find_all("li")
+    else:
+        # the text may be escaped in the HTML (e.g. as entities), search the whole tree
+        soup = BeautifulSoup(html, "html.parser")
+        section = soup.find(string=LINKS_SECTION[0]) or soup.find(
+            string=LINKS_SECTION[1]
+        )
+        if not section:
+            return []
+        li_list = section.find_next("ul").find_all("li")
+
+    urls = []
+    for li in li_list:
+        match = MARKDOWN_LINK.search(html2text.html2text(str(li)))
+        if match:
+            urls.append(match.group(2))
+    return urls
+
+
+class PageCache(SQLiteStore):
+    """A disk cache of the parsed incident pages, keyed by URL and shared by the processes.
+
+    A page older than the TTL is revalidated with a conditional request,
+    and only parsed again when its HTML changed.
+    When the network fails, or the host keeps failing, the stale page is served.
+    Above the maximum size, the least recently read pages are evicted.
+
+    Args:
+        path (Path, optional): The database file. Defaults to PAGE_CACHE_DB.
+        max_size (int, optional): In bytes. Defaults to PAGE_CACHE_SIZE.
+        ttl (float, optional): In seconds. Defaults to TTL.
+        client (FetchClient, optional): Defaults to the shared one.
+    """
+
+    def __init__(
+        self,
+        path=PAGE_CACHE_DB,
+        max_size=PAGE_CACHE_SIZE,
+        ttl=TTL,
+        client: FetchClient | None = None,
+    ):
+        super().__init__(path, SCHEMA)
+        self.max_size = max_size
+        self.ttl = ttl
+        self.client = client or get_fetch_client()
+
+    def get(self, url: str) -> CachedPage:
+        row = self.connection().execute(
+            "SELECT html_hash, description, links, etag, last_modified, fetched_at"
+            " FROM pages WHERE url = ?",
+            (url,),
+        ).fetchone()
+
+        if row is not None and time.time() - row[5] < self.ttl:
+            self._touch(url)
+            return CachedPage(row[1], json.loads(row[2]), row[5])
+
+        try:
+            return self._fetch(url, row)
+        except requests.RequestException as error:
+            if row is None:
+                raise
+            logger.warning("Could not revalidate %s, serving it stale: %s", url, error)
+            self._touch(url)
+            return CachedPage(row[1], json.loads(row[2]), row[5])
+
+    def is_fresh(self, url: str) -> bool:
+        """Whether the page is cached and does not need a revalidation."""
+        row = self.connection().execute(
+            "SELECT fetched_at FROM pages WHERE url = ?", (url,)
+        ).fetchone()
+        return row is not None and time.time() - row[0] < self.ttl
+
+    def _touch(self, url: str, fetched: bool = False):
+        now = time.time()
+        with self.connection() as connection:
+            if fetched:
+                connection.execute(
+                    "UPDATE pages SET fetched_at = ?, accessed_at = ? WHERE url = ?",
+                    (now, now, url),
+                )
+            else:
+                connection.execute(
+                    "UPDATE pages SET accessed_at = ? WHERE url = ?", (now, url)
+                )
+
+    @traced
+    def _fetch(self, url: str, row) -> CachedPage:
+        headers = {}
+        if row is not None:
+            _, _, _, etag, last_modified, _ = row
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+
+        response = self.client.get(url, headers=headers)
+        if response.status_code == 304 and row is not None:
+            self._touch(url, fetched=True)
+            return CachedPage(row[1], json.loads(row[2]), time.time())
+
+        html_hash = hashlib.sha256(response.content).hexdigest()[:16]
+        if row is not None and row[0] == html_hash:
+            self._touch(url, fetched=True)
+            return CachedPage(row[1], json.loads(row[2]), time.time())
+
+        html = response.text
+        page = CachedPage(
+            parse_incident_description(html), parse_list_of_links(html), time.time()
+        )
+        links = json.dumps(page.links)
+        with self.connection() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    url,
+                    html_hash,
+                    page.description,
+                    links,
+                    response.headers.get("ETag"),
+                    response.headers.get("Last-Modified"),
+                    page.fetched_at,
+                    page.fetched_at,
+                    len(page.description.encode()) + len(links.encode()),
+                ),
+            )
+        self.evict()
+        return page
+
+    def evict(self):
+        """Deletes the least recently read pages until the cache is below 90% of its maximum size."""
+        with self.connection() as connection:
+            (size,) = connection.execute("SELECT TOTAL(size) FROM pages").fetchone()
+            if size <= self.max_size:
+                return
+            connection.execute(
+                "DELETE FROM pages WHERE url IN ("
+                " SELECT url FROM ("
+                "  SELECT url, SUM(size) OVER (ORDER BY accessed_at DESC) AS kept FROM pages"
+                " ) WHERE kept > ?"
+                ")",
+                (0.9 * self.max_size,),
+            )
+
+
+@st.cache_resource
+def get_page_cache() -> PageCache:
+    return PageCache()
+
+
+class Prefetcher:
+    """Warms the page cache up in the background, with a cap on the requests in flight.
+
+    The pages asked for while the cap is reached are skipped,
+    the next rerun asks for them again.
+
+    Args:
+        cache (PageCache): The cache to warm up
+        max_in_flight (int, optional): Defaults to MAX_PREFETCH_IN_FLIGHT.
+    """
+
+    def __init__(self, cache: PageCache, max_in_flight: int = MAX_PREFETCH_IN_FLIGHT):
+        self.cache = cache
+        self.max_in_flight = max_in_flight
+        self.in_flight = set()
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_in_flight, thread_name_prefix="aiie-prefetch")
+
+    def prefetch(self, urls):
+        """Fetches the pages that are not cached yet, the first ones first."""
+        for url in urls:
+            with self.lock:
+                if len(self.in_flight) >= self.max_in_flight:
+                    return
+                if url in self.in_flight or self.cache.is_fresh(url):
+                    continue
+                self.in_flight.add(url)
+            # the spans of the fetch are counted on the page that asked for it
+            self.pool.submit(contextvars.copy_context().run, self._fetch, url)
+
+    def _fetch(self, url: str):
+        try:
+            self.cache.get(url)
+        except Exception as error:
+            # only speculative, the page is fetched again when actually shown
+            logger.debug("Could not prefetch %s: %s", url, error)
+        finally:
+            with self.lock:
+                self.in_flight.discard(url)
+
+
+@st.cache_resource
+def get_prefetcher() -> Prefetcher:
+    # one per server process, shared by all the sessions
+    return Prefetcher(get_page_cache())
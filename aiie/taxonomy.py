@@ -0,0 +1,76 @@
+import hashlib
+import os
+import tomllib
+from collections import namedtuple
+from functools import lru_cache
+from pathlib import Path
+
+TAXONOMY_FILE = Path(
+    os.environ.get("AIIE_TAXONOMY", Path(__file__).with_name("taxonomy.toml"))
+)
+
+# The compiled taxonomy: its version, a short hash of the file
+# and, by column, the lookup of the (case-folded) values -> merged value
+Taxonomy = namedtuple("Taxonomy", ["version", "digest", "synonyms"])
+
+
+def compile_taxonomy(document: dict) -> dict[str, dict[str, str]]:
+    """Turns the "<merged value>" = ["<value>", ...] tables into value -> merged value lookups.
+
+    Raises:
+        ValueError: A value is merged into two different values
+    """
+    synonyms = {}
+    for column, groups in document.items():
+        if not isinstance(groups, dict):
+            # e.g. the version
+            continue
+
+        lookup = {}
+        for merged, values in groups.items():
+            for value in values:
+                key = value.strip().casefold()
+                if lookup.get(key, merged) != merged:
+                    raise ValueError(
+                        f'{column}: "{value}" is merged into both "{lookup[key]}" and "{merged}"'
+                    )
+                lookup[key] = merged
+        synonyms[column] = lookup
+    return synonyms
+
+
+@lru_cache(maxsize=4)
+def load_taxonomy(path=TAXONOMY_FILE) -> Taxonomy:
+    content = Path(path).read_bytes()
+    document = tomllib.loads(content.decode())
+    return Taxonomy(
+        document.get("version", 0),
+        hashlib.sha256(content).hexdigest()[:8],
+        compile_taxonomy(document),
+    )
+
+
+def unmapped_values(values: dict, previous: dict, taxonomy: Taxonomy) -> dict[str, list[str]]:
+    """The values of the columns of the taxonomy that appeared since the previous version of the dataset.
+
+    A value is new if it is neither in the taxonomy (as a synonym or a merged value)
+    nor in the previous version. The columns without a previous version are skipped.
+
+    Args:
+        values (dict): The normalized values (see `encoding.Values`) of the new version, by column
+        previous (dict): The ones of the previous version
+        taxonomy (Taxonomy): The taxonomy they were normalized with
+    Returns:
+        dict: The new values of each column having some
+    """
+    report = {}
+    for column, lookup in taxonomy.synonyms.items():
+        if column not in values or column not in previous:
+            continue
+
+        known = set(lookup) | {merged.casefold() for merged in lookup.values()}
+        known |= {value.casefold() for value in previous[column].vocabulary}
+        new = [value for value in values[column].vocabulary if value.casefold() not in known]
+        if new:
+            report[column] = new
+    return report
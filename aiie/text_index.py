@@ -0,0 +1,189 @@
+import itertools
+import operator
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+# Separates the columns of a row in the indexed text,
+# so that a keyword never matches across two columns.
+# It also pads the end of the text (see `TrigramIndex._lookup`).
+SEPARATOR = "\x1f"
+
+# A trigram is encoded as one integer: its characters numbered by their rank
+# in the alphabet of the indexed texts, on 16 bits each (at most 65536 distinct characters).
+# The trigrams starting with the same characters are then a range of codes.
+CHAR_BITS = 16
+
+# The rows encoded at once, it bounds the memory of the build.
+# Their positions in the chunk are sorted with the trigrams, on the bits left.
+CHUNK_ROWS = 20_000
+ROW_BITS = 15
+
+
+def code_points(text: str) -> np.ndarray:
+    return np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+
+
+def trigram_codes(ranks: np.ndarray) -> np.ndarray:
+    """The codes of the trigrams of a string (given as the ranks of its characters), in order."""
+    ranks = ranks.astype(np.uint64)
+    return ranks[:-2] << 2 * CHAR_BITS | ranks[1:-1] << CHAR_BITS | ranks[2:]
+
+
+def distinct_counts(codes: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """The distinct values of a sorted array, and how many times each is repeated."""
+    starts = np.flatnonzero(np.diff(codes, prepend=~codes[:1]))
+    return codes[starts], np.diff(starts, append=codes.size)
+
+
+class TrigramIndex:
+    """Inverted index mapping every trigram of the (lower-cased) rows text to the rows containing it.
+
+    A keyword of 3 characters or more is looked up by intersecting the posting lists
+    of its trigrams, then verified on the few remaining candidates.
+    A shorter keyword is the prefix of the trigrams starting where it occurs,
+    so it is looked up by the union of their posting lists.
+
+    The posting lists are stored one after the other in `rows`, in the order of
+    the (sorted) codes of their trigrams, they are built by chunks of rows
+    with numpy (see `trigram_codes`).
+
+    Args:
+        df (pd.DataFrame): The dataframe to index, all its columns are searchable.
+    Raises:
+        ValueError: The texts have more distinct characters than the codes can number
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.index = df.index
+        self.size = len(df)
+
+        # one string per row, all the columns concatenated
+        texts = df.fillna("").astype(str)
+        texts = (
+            texts.iloc[:, 0]
+            .str.cat([texts[col] for col in texts.columns[1:]], sep=SEPARATOR)
+            .str.lower()
+            + SEPARATOR * 2
+        )
+        self.texts = texts.to_numpy()
+        chunks = range(0, self.size, CHUNK_ROWS)
+
+        # the characters of the texts, as sorted code points
+        seen = np.zeros(0x110000, dtype=bool)
+        for start in chunks:
+            seen[code_points("".join(self.texts[start : start + CHUNK_ROWS]))] = True
+        self.alphabet = np.flatnonzero(seen).astype(np.uint32)
+        if len(self.alphabet) > 1 << CHAR_BITS:
+            raise ValueError(f"More than {1 << CHAR_BITS} distinct characters to index")
+        # the rank of every code point (the ones not in the alphabet are never looked up)
+        self.char_ranks = (np.cumsum(seen) - 1).astype(np.uint16)
+
+        # the chunks are encoded twice rather than all their (trigram, row) pairs held at once,
+        # first the trigrams and the length of their posting lists...
+        counted = []
+        for start in chunks:
+            codes, _ = self._chunk_trigrams(self.texts[start : start + CHUNK_ROWS])
+            counted.append(distinct_counts(codes))
+
+        self.trigrams = np.unique(
+            np.concatenate([codes for codes, _ in counted] + [np.empty(0, dtype=np.uint64)])
+        )
+        lengths = np.zeros(self.trigrams.size, dtype=np.int64)
+        for codes, counts in counted:
+            lengths[np.searchsorted(self.trigrams, codes)] += counts
+        self.offsets = np.concatenate([[0], np.cumsum(lengths)])
+
+        # ...then the rows, appended to the posting lists chunk after chunk (in order)
+        self.rows = np.empty(self.offsets[-1], dtype=np.int32)
+        filled = self.offsets[:-1].copy()
+        for start in chunks:
+            codes, rows = self._chunk_trigrams(self.texts[start : start + CHUNK_ROWS])
+            codes, counts = distinct_counts(codes)
+            ids = np.searchsorted(self.trigrams, codes)
+            # the rows of a trigram go after the ones of the previous chunks
+            position = np.arange(rows.size) - np.repeat(np.cumsum(counts) - counts, counts)
+            self.rows[np.repeat(filled[ids], counts) + position] = rows + start
+            filled[ids] += counts
+
+        # the same keywords come back at every rerun (and every keystroke)
+        self.lookup = lru_cache(maxsize=1024)(self._lookup)
+
+    def _ranks(self, chars: np.ndarray) -> np.ndarray | None:
+        """The ranks of characters in the alphabet, None if some are not in it."""
+        if not np.isin(chars, self.alphabet).all():
+            return None
+        return self.char_ranks[chars]
+
+    def _chunk_trigrams(self, texts: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """The distinct (trigram, row) pairs of some texts, sorted by trigram code then row.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: The codes of the trigrams, and their rows in `texts`
+        """
+        lengths = np.fromiter(map(len, texts), dtype=np.int64, count=len(texts))
+        codes = trigram_codes(self.char_ranks[code_points("".join(texts))])
+        rows = np.repeat(np.arange(len(texts), dtype=np.uint64), lengths)[:-2]
+
+        # not the trigrams overlapping two texts (starting at one of the last 2 characters)
+        inside = np.ones(codes.size, dtype=bool)
+        ends = np.cumsum(lengths)
+        inside[ends[:-1] - 2] = inside[ends[:-1] - 1] = False
+
+        # sorted and deduplicated at once, the row is in the low bits
+        keys = np.unique(codes[inside] << ROW_BITS | rows[inside])
+        return keys >> ROW_BITS, (keys & ((1 << ROW_BITS) - 1)).astype(np.int32)
+
+    def _postings(self, first: int, last: int) -> np.ndarray:
+        """The rows of the trigrams whose codes are in [first, last), possibly repeated."""
+        start, stop = np.searchsorted(self.trigrams, [first, last])
+        return self.rows[self.offsets[start] : self.offsets[stop]]
+
+    def _lookup(self, keyword: str) -> np.ndarray:
+        """Returns the (read-only) boolean mask of the rows containing the keyword."""
+        mask = np.zeros(self.size, dtype=bool)
+        # a character that is nowhere in the texts is in no row
+        ranks = self._ranks(code_points(keyword))
+        if not keyword:
+            mask[:] = True
+        elif ranks is None:
+            pass
+        elif len(keyword) < 3:
+            # the codes of the trigrams starting with the keyword
+            first = 0
+            for position, rank in enumerate(ranks):
+                first |= int(rank) << (2 - position) * CHAR_BITS
+            mask[self._postings(first, first + (1 << (3 - len(keyword)) * CHAR_BITS))] = True
+        else:
+            # the shortest posting lists first, the intersection shrinks faster
+            lists = sorted(
+                (self._postings(code, code + 1) for code in np.unique(trigram_codes(ranks))),
+                key=len,
+            )
+            candidates = lists[0]
+            for rows in lists[1:]:
+                if not candidates.size:
+                    break
+                candidates = np.intersect1d(candidates, rows, assume_unique=True)
+
+            # having all the trigrams does not mean having them in the right order,
+            # the texts of the candidates are searched in one pass, without a Python loop
+            if len(keyword) > 3 and candidates.size:
+                texts = self.texts[candidates]
+                found = np.fromiter(
+                    map(operator.contains, texts, itertools.repeat(keyword)),
+                    dtype=bool,
+                    count=texts.size,
+                )
+                candidates = candidates[found]
+            mask[candidates] = True
+
+        mask.flags.writeable = False
+        return mask
+
+    def align(self, mask: np.ndarray, index: pd.Index) -> np.ndarray:
+        """Re-orders a mask over the indexed rows to match the rows of another index."""
+        if index.equals(self.index):
+            return mask
+        return mask[self.index.get_indexer(index)]
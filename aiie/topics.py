@@ -0,0 +1,204 @@
+import hashlib
+import logging
+import os
+from collections import namedtuple
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+import streamlit as st
+from data import CACHE_DIR, SNAPSHOT_DIR, C, load_snapshot, temporary_path
+from descriptions import DescriptionStore, get_description_store
+from jobs import get_job_runner, job_result, report_progress
+from sklearn.decomposition import LatentDirichletAllocation
+from sklearn.feature_extraction.text import CountVectorizer
+
+TOPICS_DIR = CACHE_DIR / "topics"
+
+# Above this share of new (or edited) documents, the model is refitted
+# instead of updating the model of a previous version with `partial_fit`
+MAX_NEW_DOCUMENTS = 0.25
+
+# How often the sessions check whether the crawler has scraped new descriptions (in seconds)
+DIGEST_TTL = 600
+
+logger = logging.getLogger(__name__)
+
+# The fitted model of a version of the dataset:
+# the words, the (topics x words) weights and the (incidents x topics) distributions
+TopicModel = namedtuple("TopicModel", ["words", "components", "doc_topics"])
+
+
+def incident_texts(df: pd.DataFrame, descriptions: pd.Series) -> pd.Series:
+    """The title and the description of the incidents having one."""
+    texts = df[C.title] + ", " + descriptions.reindex(df.index)
+    return texts.dropna()
+
+
+def descriptions_digest(descriptions: pd.Series) -> str | None:
+    """A digest of a set of descriptions (and of their ids), None if there is none."""
+    if descriptions.empty:
+        return None
+    hashes = pd.util.hash_pandas_object(descriptions.sort_index().astype(str))
+    return hashlib.sha256(hashes.to_numpy().tobytes()).hexdigest()[:12]
+
+
+@st.cache_data(ttl=DIGEST_TTL, show_spinner=False)
+def current_descriptions_digest(version: str, _ids: pd.Index) -> str | None:
+    # the ids are the ones of the version
+    return descriptions_digest(get_description_store().get(_ids))
+
+
+def topic_model_path(version: str, digest: str, n_components: int) -> Path:
+    return TOPICS_DIR / f"{version}-{digest}-k{n_components}.joblib"
+
+
+def previous_topic_model(path: Path, n_components: int) -> Path | None:
+    """The most recent other model (of another version or other descriptions) with the same number of topics."""
+    candidates = [
+        candidate
+        for candidate in TOPICS_DIR.glob(f"*-k{n_components}.joblib")
+        if candidate != path
+    ]
+    return max(candidates, key=lambda candidate: candidate.stat().st_mtime, default=None)
+
+
+def fit_topics(texts: pd.Series, n_components: int) -> dict:
+    """Fits an LDA topic model on all the texts."""
+    report_progress(0.1, "Counting the words")
+    vectorizer = CountVectorizer(stop_words="english")
+    tf = vectorizer.fit_transform(texts.to_list())
+
+    report_progress(0.3, "Fitting the topics")
+    lda = LatentDirichletAllocation(
+        n_components=n_components,
+        max_iter=5,
+        learning_method="online",
+        learning_offset=50.0,
+        random_state=42,
+    ).fit(tf)
+
+    return {"vectorizer": vectorizer, "lda": lda, "tf": tf}
+
+
+def update_topics(artifact: dict, texts: pd.Series, new: np.ndarray) -> dict:
+    """Folds the new documents into a fitted model with `partial_fit`.
+
+    The vocabulary stays the one of the first fit, the words it has never seen are ignored.
+    """
+    report_progress(0.3, f"Updating the topics with {new.sum()} new incidents")
+    tf = artifact["vectorizer"].transform(texts.to_list())
+    if new.any():
+        artifact["lda"].partial_fit(tf[new])
+    return {**artifact, "tf": tf}
+
+
+def build_topic_model(snapshot: str, digest: str, n_components: int) -> str:
+    """Fits the topic model of a version of the dataset, over all the descriptions (in a worker).
+
+    The model is persisted to the cache directory, with the topic distribution
+    of every incident: the filtered views only aggregate them.
+    For a new version of the sheet, or new descriptions scraped by the crawler,
+    the previous model is updated with the new (or edited) incidents when there are few of them.
+
+    Args:
+        snapshot (str): The path of the snapshot of the dataset
+        digest (str): The digest of its descriptions (see `descriptions_digest`)
+        n_components (int): The number of topics
+    Returns:
+        str: The path of the model
+    Raises:
+        ValueError: No incident of the dataset has a description
+    """
+    version = Path(snapshot).stem
+    path = topic_model_path(version, digest, n_components)
+    if path.exists():
+        return str(path)
+
+    report_progress(0.05, "Loading the descriptions")
+    df = load_snapshot(Path(snapshot))
+    texts = incident_texts(df, DescriptionStore().get(df.index))
+    if texts.empty:
+        raise ValueError("No incident description to fit the topics on")
+    signatures = pd.util.hash_array(texts.to_numpy(dtype=object))
+
+    artifact = None
+    previous_path = previous_topic_model(path, n_components)
+    if previous_path is not None:
+        previous = joblib.load(previous_path)
+        # (no NaN for the missing ids, the hashes do not survive a cast to float)
+        new = previous["signatures"].reindex(texts.index, fill_value=0).to_numpy()
+        new = new != signatures
+        if new.sum() <= MAX_NEW_DOCUMENTS * len(texts):
+            artifact = update_topics(previous, texts, new)
+            logger.info(
+                "LDA: %d incidents folded into the model of %s",
+                new.sum(),
+                previous_path.name,
+            )
+
+    if artifact is None:
+        artifact = fit_topics(texts, n_components)
+
+    report_progress(0.8, "Computing the topics of the incidents")
+    tf = artifact.pop("tf")
+    artifact["doc_topics"] = pd.DataFrame(
+        artifact["lda"].transform(tf), index=texts.index
+    )
+    artifact["signatures"] = pd.Series(signatures, index=texts.index)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = temporary_path(path)
+    joblib.dump(artifact, tmp_path)
+    os.replace(tmp_path, path)
+    return str(path)
+
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def load_topic_model(path: str) -> TopicModel:
+    artifact = joblib.load(path)
+    return TopicModel(
+        artifact["vectorizer"].get_feature_names_out(),
+        artifact["lda"].components_,
+        artifact["doc_topics"],
+    )
+
+
+def get_topic_model(version: str, ids: pd.Index, n_components: int) -> TopicModel | None:
+    """The topic model of a version of the dataset, or None while it is fitted in the background.
+
+    Args:
+        version (str): The version of the dataset
+        ids (pd.Index): Its ids
+        n_components (int): The number of topics
+    Returns:
+        TopicModel | None: The model of the current descriptions of the incidents
+    """
+    digest = current_descriptions_digest(version, ids)
+    if digest is None:
+        st.info(
+            "No incident description has been scraped yet, "
+            "the topics will be fitted once the crawler has run (see crawler.py) "
+            "or the former descriptions are migrated "
+            "(`python descriptions.py --migrate description`).",
+            icon="ℹ️",
+        )
+        return None
+
+    path = topic_model_path(version, digest, n_components)
+    if not path.exists():
+        # the version is the name of the snapshot (see `load_dataset`)
+        snapshot = SNAPSHOT_DIR / f"{version}.feather"
+        job = get_job_runner().submit(
+            f"lda-{path.stem}", build_topic_model, str(snapshot), digest, n_components
+        )
+        if job_result(job, "Fitting the topics...") is None:
+            return None
+
+    return load_topic_model(str(path))
+
+
+def topic_prevalence(model: TopicModel, index: pd.Index) -> pd.Series:
+    """The average topic distribution of the incidents of a (filtered) view."""
+    return model.doc_topics.reindex(index).dropna().mean().fillna(0)
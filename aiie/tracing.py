@@ -0,0 +1,186 @@
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque, namedtuple
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import numpy as np
+import pandas as pd
+
+# Set to 0 to turn the spans into no-ops
+TRACING = os.environ.get("AIIE_TRACING", "1") != "0"
+
+# Every span is also appended to this file (as JSON lines), if set
+TRACE_FILE = os.environ.get("AIIE_TRACE_FILE")
+
+# The page of the spans ending outside of the reruns
+BACKGROUND = "(background)"
+
+# The recent spans kept in memory (for the admin page and the export)
+MAX_SPANS = 20_000
+
+# The upper bounds of the buckets of the histograms, in ms (the last bucket has none)
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000)
+
+# A finished span: its trace groups the spans of a rerun (or of a background task),
+# the parent is the name of the enclosing span, the start is a timestamp
+Span = namedtuple(
+    "Span", ["name", "page", "trace", "parent", "depth", "start", "duration", "error"]
+)
+
+# The span being timed (its name, trace and depth) and the page being run,
+# they follow the code down the calls (and into the tasks submitted with their context)
+_current_span = ContextVar("current_span", default=None)
+_current_page = ContextVar("current_page", default=None)
+
+_trace_ids = itertools.count(1)
+
+
+class Histogram:
+    """The durations of the spans of a name (on a page), counted in the buckets of BUCKETS_MS."""
+
+    def __init__(self):
+        self.counts = np.zeros(len(BUCKETS_MS) + 1, dtype=np.int64)
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, duration_ms: float):
+        self.counts[bisect_left(BUCKETS_MS, duration_ms)] += 1
+        self.total += duration_ms
+        self.max = max(self.max, duration_ms)
+
+    def quantile(self, q: float) -> float:
+        """The upper bound of the bucket of the quantile (at most the max), in ms."""
+        position = np.searchsorted(np.cumsum(self.counts), q * self.counts.sum())
+        return min(BUCKETS_MS[position], self.max) if position < len(BUCKETS_MS) else self.max
+
+
+class Tracer:
+    """Collects the finished spans of the process: the recent ones and their histograms by page.
+
+    Args:
+        max_spans (int, optional): The recent spans kept. Defaults to MAX_SPANS.
+        trace_file (str, optional): Also appends the spans to this file, as JSON lines.
+    """
+
+    def __init__(self, max_spans: int = MAX_SPANS, trace_file: str | None = None):
+        self.lock = threading.Lock()
+        self.spans = deque(maxlen=max_spans)
+        self.histograms = {}
+        self.trace_file = open(trace_file, "a", buffering=1) if trace_file else None
+
+    def record(self, span: Span):
+        with self.lock:
+            self.spans.append(span)
+            key = (span.page, span.name)
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].add(span.duration * 1000)
+            if self.trace_file is not None:
+                self.trace_file.write(json.dumps(span._asdict()) + "\n")
+
+    def recent_spans(self) -> pd.DataFrame:
+        with self.lock:
+            return pd.DataFrame(list(self.spans), columns=Span._fields)
+
+    def summary(self) -> pd.DataFrame:
+        """The count, mean, quantiles and max (in ms) of every span name, by page."""
+        rows = []
+        with self.lock:
+            for (page, name), h in self.histograms.items():
+                count = int(h.counts.sum())
+                rows.append(
+                    (page, name, count, h.total / count, h.quantile(0.5), h.quantile(0.95), h.max)
+                )
+        return pd.DataFrame(
+            rows, columns=["page", "span", "count", "mean_ms", "p50_ms", "p95_ms", "max_ms"]
+        ).sort_values(["page", "mean_ms"], ascending=[True, False], ignore_index=True)
+
+    def histogram(self, page: str, name: str) -> pd.Series:
+        """The number of spans in each bucket, labelled by its upper bound."""
+        with self.lock:
+            counts = self.histograms[(page, name)].counts.copy()
+        labels = [f"≤{bound}ms" for bound in BUCKETS_MS] + [f">{BUCKETS_MS[-1]}ms"]
+        return pd.Series(counts, index=labels)
+
+    def json_lines(self) -> str:
+        with self.lock:
+            return "".join(json.dumps(span._asdict()) + "\n" for span in self.spans)
+
+    def reset(self):
+        with self.lock:
+            self.spans.clear()
+            self.histograms.clear()
+
+
+# Not a cache_resource: the spans also end in the background threads,
+# outside of the reruns
+TRACER = Tracer(trace_file=TRACE_FILE)
+
+
+@contextmanager
+def span(name: str):
+    """Times the enclosed code as a span, nested in the current one (if any).
+
+    The exceptions go through, the span records that it failed.
+    """
+    if not TRACING:
+        yield
+        return
+
+    parent = _current_span.get()
+    if parent is None:
+        parent_name, trace, depth = None, next(_trace_ids), 0
+    else:
+        parent_name, trace, depth = parent[0], parent[1], parent[2] + 1
+    token = _current_span.set((name, trace, depth))
+
+    start, started = time.time(), time.perf_counter()
+    error = False
+    try:
+        yield
+    except Exception:
+        # not st.rerun() and st.stop(), they are not failures
+        error = True
+        raise
+    finally:
+        _current_span.reset(token)
+        TRACER.record(
+            Span(
+                name,
+                _current_page.get() or BACKGROUND,
+                trace,
+                parent_name,
+                depth,
+                start,
+                time.perf_counter() - started,
+                error,
+            )
+        )
+
+
+def traced(func):
+    """Decorates a function (or a method), every call is a span named after it."""
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with span(func.__qualname__):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+@contextmanager
+def trace_page(page: str):
+    """A rerun of a page: the root span of the ones below, which are counted on this page."""
+    token = _current_page.set(page)
+    try:
+        with span("rerun"):
+            yield
+    finally:
+        _current_page.reset(token)
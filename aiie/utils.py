@@ -1,72 +1,45 @@
 import base64
 from collections import namedtuple
 from pathlib import Path
-import re
-import html2text
+from typing import TYPE_CHECKING
 import numpy as np
 import pandas as pd
 import plotly.express as px
-import requests
 import streamlit as st
-from bs4 import BeautifulSoup
-from markdownify import markdownify
+from data import get_dataset, normalize_column
+from encoding import Values
+from facets import FacetEngine
 from pandas.api.types import (
     is_datetime64_any_dtype,
     is_numeric_dtype,
     is_object_dtype,
 )
+from text_index import TrigramIndex
+from tracing import span, traced
 
-TTL = 30 * 60 * 24
+if TYPE_CHECKING:
+    from descriptions import DescriptionStore
 
 # TODO: put the repo url here
 github_repo_url = "https://github.com/dbbz/AIIE/issues"
 deploy_url = "https://aiiexp.streamlit.app/"
 
 
-@st.cache_data(ttl=TTL, show_spinner="Fetching more information about the incident...")
+@traced
 def scrap_incident_description(link):
-    soup = BeautifulSoup(requests.get(link).text, "html.parser")
+    # the HTML parsers are only imported once a page is scraped
+    from scraping import get_page_cache
 
-    # This is dangeriously hard-coded.
-    description = soup.find_all(
-        # class_="hJDwNd-AhqUyc-uQSCkd Ft7HRd-AhqUyc-uQSCkd purZT-AhqUyc-II5mzb ZcASvf-AhqUyc-II5mzb pSzOP-AhqUyc-qWD73c Ktthjf-AhqUyc-qWD73c JNdkSc SQVYQc"
-        class_="hJDwNd-AhqUyc-uQSCkd Ft7HRd-AhqUyc-uQSCkd jXK9ad D2fZ2 zu5uec OjCsFc dmUFtb wHaque g5GTcb"
-    )
-
-    header_pattern = r"^(#+)\s+(.*)"
-    description = markdownify("\n".join((str(i) for i in description[1:-1])))
-    description = re.sub(header_pattern, r"#### \2", description)
-
-    description = description.replace(
-        "](/aiaaic-repository",
-        "](https://www.aiaaic.org/aiaaic-repository",
-    ).replace("### ", "##### ")
-    return description
+    with st.spinner("Fetching more information about the incident..."):
+        return get_page_cache().get(link).description
 
 
-@st.cache_data(ttl=TTL, show_spinner="Fetching the list of links on the incident...")
+@traced
 def get_list_of_links(page_url):
-    soup = BeautifulSoup(requests.get(page_url).text, "html.parser")
-    section = soup.find(string=re.compile(", commentar"))
+    from scraping import get_page_cache
 
-    if not section:
-        section = soup.find(string=re.compile("act check 🚩"))
-    if section:
-        li_list = section.find_next("ul").find_all("li")
-        # results = markdownify("\n".join(str(i) for i in li_list))
-        results = [html2text.html2text(str(i)) for i in li_list]
-
-        pattern = r"\[([^][]*)\]\(([^()]*)\)"
-        urls = []
-        for link in results:
-            match = re.search(pattern, link)
-            if match:
-                urls.append(match.group(2))
-
-        # links = [get_deepest_text(li) for li in li_list]
-        return urls
-    else:
-        return []
+    with st.spinner("Fetching the list of links on the incident..."):
+        return get_page_cache().get(page_url).links
 
 
 # this function comes from Streamlit-Extra
@@ -106,11 +79,45 @@ def named_tabs(*tab_names):
     return TabsNames(*tabs)
 
 
+def column_values(df: pd.DataFrame, col: str) -> Values:
+    """The normalized values of a column of (a subset of) the dataset, row i being df.iloc[i].
+
+    They are taken from the ones computed at ingest, a dataframe
+    with rows that are not in the dataset gets its values normalized on the fly.
+    """
+    try:
+        return get_dataset().values(col, df.index)
+    except KeyError:
+        return normalize_column(df, col)
+
+
+def values_contain(df: pd.DataFrame, col: str, text: str) -> np.ndarray:
+    """The mask of the rows having a value of the column containing the text (case-insensitive)."""
+    rows, codes, vocabulary = column_values(df, col)
+    # the text is only searched in the distinct values
+    matching = (
+        pd.Series(vocabulary, dtype=object)
+        .str.casefold()
+        .str.contains(text.strip().casefold(), regex=False)
+    )
+    mask = np.zeros(len(df), dtype=bool)
+    mask[rows[matching.to_numpy(dtype=bool)[codes]]] = True
+    return mask
+
+
 # TODO: replace this filter with an event-based filtering + state management
 # TODO: include nans too
+@traced
 def category_text_filter(df, mask, column_names) -> np.ndarray:
     category_filters = {col: [] for col in column_names}
-    df = df[mask]
+    mask = np.asarray(mask, dtype=bool)
+
+    # the facets of the shared dataset are built once per version,
+    # any other dataframe gets its own (throw-away) ones
+    facets = get_dataset().facets
+    if not df.index.equals(facets.index):
+        facets = FacetEngine(df.index, lambda col: column_values(df, col))
+
     # with st.expander("Filter by category", expanded=True):
     with st.container():
         st.caption("Filter by category")
@@ -125,29 +132,24 @@ def category_text_filter(df, mask, column_names) -> np.ndarray:
                     max_value=max_value,
                     value=(min_value, max_value),
                 )
-                mask = mask & df[col].between(*min_max)
+                mask = mask & df[col].between(*min_max).to_numpy()
             else:
-                # df[col] = df[col].fillna("None")  # TMP
-                counts = (
-                    df.loc[mask, col]
-                    .dropna()
-                    .value_counts(dropna=False)
-                    .reset_index()
-                    .set_axis([col, "counts"], axis=1)
-                )
-                # counts.fillna("Unknown", inplace=True)
-                # st.sidebar.write(counts)
-                counts["labels"] = (
-                    counts[col] + " (" + counts["counts"].astype(str) + ")"
-                )
+                # the counts of the individual values (not of the joined strings)
+                counts = facets.counts(col, mask)
+
+                # the values filtered out by the other columns disappear,
+                # except for the selected ones (they would raise otherwise)
+                selected = st.session_state.get("cat_" + col, [])
+                options = counts.index[(counts > 0) | counts.index.isin(selected)]
+
                 category_filters[col] = st.multiselect(
                     col,
-                    counts[col].sort_values().unique(),
-                    format_func=lambda x: counts.set_index(col).loc[x, "labels"],
+                    options,
+                    format_func=lambda x, counts=counts: f"{x} ({counts[x]})",
                     key="cat_" + col,
                 )
                 if category_filters[col]:
-                    mask = mask & df[col].isin(category_filters[col])
+                    mask = mask & facets.mask(col, category_filters[col])
 
     # for col, selected_values in category_filters.items():
     #     if selected_values:
@@ -156,6 +158,7 @@ def category_text_filter(df, mask, column_names) -> np.ndarray:
 
 
 # make_dataframe_filters()
+@traced
 def dataframe_with_filters(
     df: pd.DataFrame, on_columns: list, mask: np.ndarray | None = None
 ) -> np.ndarray:
@@ -176,28 +179,62 @@ def dataframe_with_filters(
         help="Case-insensitive, comma-separated keywords. Prefix with ~ to exclude.",
     )
 
+    # the descriptions are only searchable once they have been scraped
+    # (the other pages importing this module do not open the store)
+    from descriptions import get_description_store
+
+    descriptions = get_description_store()
+    if len(descriptions) and not st.toggle(
+        "Search the incident descriptions too",
+        help="Matches the words of the descriptions starting with the keywords.",
+    ):
+        descriptions = None
+
+    search_index = get_dataset().search_index
+    mask &= search_index.align(
+        keywords_mask(search, search_index, descriptions), df.index
+    )
+
+    return mask
+
+
+def keywords_mask(
+    search: str,
+    search_index: TrigramIndex,
+    descriptions: "DescriptionStore | None" = None,
+) -> np.ndarray:
+    """
+    Matches comma-separated keywords against the rows of an index.
+
+    Args:
+        search (str): The keywords, the ones prefixed with ~ are excluded
+        search_index (TrigramIndex): The index of the rows to match
+        descriptions (DescriptionStore, optional): Also match the keywords against
+            the full-text index of the descriptions. Defaults to None.
+    Returns:
+        np.ndarray: Mask of the rows containing all the keywords (and none of the excluded ones)
+    """
+    mask = np.full(search_index.size, True, dtype=bool)
+
     search = [s.strip().lower() for s in search.split(",")]
     is_excluded = [s.startswith("~") for s in search]
 
     assert len(search) == len(is_excluded)
 
     search = [s.lstrip("~") for s in search]
-    if search:
-        for elem, exclude in zip(search, is_excluded):
-            if elem and exclude:
-                mask &= ~df.apply(
-                    lambda row: row.astype(str).str.lower().str.contains(elem).any(),
-                    axis=1,
-                )
-            else:
-                mask &= df.apply(
-                    lambda row: row.astype(str).str.lower().str.contains(elem).any(),
-                    axis=1,
-                )
+    for elem, exclude in zip(search, is_excluded):
+        elem_mask = search_index.lookup(elem)
+        if elem and descriptions is not None:
+            elem_mask = elem_mask | search_index.index.isin(descriptions.search(elem))
+        if elem and exclude:
+            mask &= ~elem_mask
+        else:
+            mask &= elem_mask
 
     return mask
 
 
+@traced
 @st.cache_data
 def retain_most_frequent_values(df: pd.DataFrame, col: str, N: int) -> pd.DataFrame:
     top_N_values = (
@@ -228,7 +265,8 @@ def plot_counts(df, column, top_N):
         orientation="h",
         title=f"Top {top_N} {column} by count",
     )
-    st.plotly_chart(fig, use_container_width=True)
+    with span("st.plotly_chart"):
+        st.plotly_chart(fig, use_container_width=True)
 
 
 @st.cache_data
@@ -236,45 +274,70 @@ def _df_groupby(df, cols):
     return df.groupby(cols).size().to_frame(name="counts").reset_index()
 
 
-def gen_sankey(df, cat_cols=[], value_cols="", title="Sankey Diagram"):
+@traced
+def gen_sankey(
+    df, cat_cols=[], value_cols=None, title="Sankey Diagram", top_n=None
+):
+    """
+    Builds a Sankey diagram of the flows between consecutive columns.
+
+    The multi-valued cells are exploded (an incident with 2 countries and 3 sectors
+    makes 6 country -> sector links) and every column has its own nodes,
+    a value appearing in two columns makes two distinct nodes.
+
+    Args:
+        df (pd.DataFrame): The rows to plot
+        cat_cols (list of strings): The columns, from left to right
+        value_cols (str, optional): A column of weights (e.g. counts). Defaults to 1 per row.
+        title (str, optional): The title of the figure
+        top_n (int, optional): Values per column, the rarer ones are merged into "Other"
+    Returns:
+        dict: The plotly figure
+    """
     # maximum of 6 value cols -> 6 colors
     color_palette = ["#4B8BBE", "#306998", "#FFE873", "#FFD43B", "#646464"]
-    label_list = []
-    color_num_list = []
-    for cat_col in cat_cols:
-        label_list_temp = list(set(df[cat_col].values))
-        color_num_list.append(len(label_list_temp))
-        label_list = label_list + label_list_temp
-
-    # remove duplicates from label_list
-    label_list = list(dict.fromkeys(label_list))
+    weights = (
+        np.ones(len(df)) if value_cols is None else df[value_cols].to_numpy(dtype=float)
+    )
 
-    # define colors based on number of levels
+    # the (row, node id) pairs of every column, the ids of a column follow the previous ones
+    label_list = []
     color_list = []
-    for idx, color_num in enumerate(color_num_list):
-        color_list = color_list + [color_palette[idx]] * color_num
-
-    # transform df into a source-target pair
-    for i in range(len(cat_cols) - 1):
-        if i == 0:
-            source_target_df = df[[cat_cols[i], cat_cols[i + 1], value_cols]]
-            source_target_df.columns = ["source", "target", "count"]
-        else:
-            temp_df = df[[cat_cols[i], cat_cols[i + 1], value_cols]]
-            temp_df.columns = ["source", "target", "count"]
-            source_target_df = pd.concat([source_target_df, temp_df])
-        source_target_df = (
-            source_target_df.groupby(["source", "target"])
-            .agg({"count": "sum"})
-            .reset_index()
+    nodes = []
+    for idx, cat_col in enumerate(cat_cols):
+        rows, codes, vocabulary = column_values(df, cat_col)
+        counts = np.bincount(codes, minlength=len(vocabulary))
+
+        # the node of each value, the unused values have none
+        kept = counts > 0
+        if top_n is not None and kept.sum() > top_n:
+            kept = np.zeros(len(vocabulary), dtype=bool)
+            kept[np.argsort(-counts, kind="stable")[:top_n]] = True
+        labels = vocabulary[kept].tolist()
+        node_of = np.cumsum(kept) - 1
+        if not kept[codes].all():
+            node_of[~kept] = len(labels)
+            labels.append("Other")
+
+        nodes.append(
+            pd.DataFrame({"row": rows, "node": node_of[codes] + len(label_list)})
+            .drop_duplicates()
         )
-
-    # add index for source-target pair
-    source_target_df["sourceID"] = source_target_df["source"].apply(
-        lambda x: label_list.index(x)
-    )
-    source_target_df["targetID"] = source_target_df["target"].apply(
-        lambda x: label_list.index(x)
+        label_list += labels
+        color_list += [color_palette[idx % len(color_palette)]] * len(labels)
+
+    # transform the consecutive columns into source-target pairs, aggregated
+    links = [
+        source.merge(target, on="row", suffixes=("_source", "_target"))
+        for source, target in zip(nodes[:-1], nodes[1:])
+    ]
+    source_target_df = (
+        pd.concat(links)
+        .assign(count=lambda x: weights[x["row"]])
+        .groupby(["node_source", "node_target"], as_index=False)["count"]
+        .sum()
+        if links
+        else pd.DataFrame(columns=["node_source", "node_target", "count"])
     )
 
     # creating the sankey diagram
@@ -285,11 +348,11 @@ def gen_sankey(df, cat_cols=[], value_cols="", title="Sankey Diagram"):
             thickness=20,
             line=dict(color="black", width=0.5),
             label=label_list,
-            # color=color_list,
+            color=color_list,
         ),
         link=dict(
-            source=source_target_df["sourceID"],
-            target=source_target_df["targetID"],
+            source=source_target_df["node_source"],
+            target=source_target_df["node_target"],
             value=source_target_df["count"],
         ),
     )
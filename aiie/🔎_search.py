@@ -7,20 +7,17 @@ st.set_page_config(
     initial_sidebar_state="expanded",
 )
 
-import shelve
-
 import numpy as np
 import pandas as pd
 import streamlit as st
-from data import get_clean_data
-from sklearn.decomposition import LatentDirichletAllocation
-from sklearn.feature_extraction.text import CountVectorizer
+from data import get_clean_data, get_dataset
+from topics import get_topic_model, topic_prevalence
 from utils import (
-    _df_groupby,
     dataframe_with_filters,
     gen_sankey,
     retain_most_frequent_values,
     category_text_filter,
+    values_contain,
 )
 
 st.logo(image="img/logo.png", link="http://aiiexp.streamlit.app")
@@ -156,19 +153,16 @@ if tabs_names:
                 mask = np.full_like(df.index, True, dtype=bool)
                 for col, filered_text in text_filters.items():
                     if filered_text.strip():
-                        mask = mask & df[col].str.lower().str.contains(
-                            filered_text.lower()
-                        )
+                        mask = mask & values_contain(df, col, filered_text)
 
                 if len(sankey_vars) > 1:
                     df_mask = df[mask]
-                    df_sankey = _df_groupby(df_mask, sankey_vars)
                     fig = gen_sankey(
-                        df_sankey,
+                        df_mask,
                         sankey_vars,
-                        "counts",
-                        None,
-                        # " - ".join(sankey_vars),
+                        title=None,
+                        # title=" - ".join(sankey_vars),
+                        top_n=None if top_N == "all" else int(top_N),
                     )
                     st.plotly_chart(fig, use_container_width=True)
         elif col == "Topic analysis":
@@ -189,29 +183,16 @@ if tabs_names:
 
 
 if enable_topic_modeling:
-    with shelve.open("description", "r") as db:
-        df_description = pd.DataFrame.from_dict(
-            db, orient="index", columns=["Description"]
-        )
-
-        df_description = df.join(df_description).dropna()
-        df_description = df_description[C.title] + ", " + df_description.Description
-
-    if not df_description.empty:
-        incident_texts = df_description.to_list()
-        n_top_words = 10
-
-        tf_vectorizer = CountVectorizer(stop_words="english")
-        tf = tf_vectorizer.fit_transform(incident_texts)
-        feature_names = tf_vectorizer.get_feature_names_out()
-
-        lda = LatentDirichletAllocation(
-            n_components=n_components,
-            max_iter=5,
-            learning_method="online",
-            learning_offset=50.0,
-            random_state=42,
-        ).fit(tf)
+    # fitted once per version of the sheet over all the descriptions (in the background),
+    # the filters only average the topic distributions of the incidents shown
+    with plots_tabs[-1]:
+        dataset = get_dataset()
+        topic_model = get_topic_model(dataset.version, dataset.df.index, n_components)
+
+    n_top_words = 10
+    if topic_model is not None:
+        prevalence = topic_prevalence(topic_model, df.index)
+        feature_names = topic_model.words
 
         # topics = {}
         # for topic_idx, topic in enumerate(lda.components_):
@@ -227,7 +208,7 @@ if enable_topic_modeling:
 
         with plots_tabs[-1]:
             n_cols = 3
-            for idx, topic in enumerate(lda.components_):
+            for idx, topic in enumerate(topic_model.components):
                 if idx % n_cols == 0:
                     topics_cols = st.columns(n_cols)
                 top_features_ind = topic.argsort()[-n_top_words:]
@@ -237,8 +218,8 @@ if enable_topic_modeling:
                     {"word": top_features, "weight": weights}
                 ).set_index("word")
                 topics_cols[idx % n_cols].plotly_chart(
-                    df_topic.plot.barh(title=f"Topic {idx + 1}").update_layout(
-                        showlegend=False
-                    ),
+                    df_topic.plot.barh(
+                        title=f"Topic {idx + 1} ({prevalence.get(idx, 0):.0%})"
+                    ).update_layout(showlegend=False),
                     use_container_width=True,
                 )
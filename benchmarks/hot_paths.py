@@ -0,0 +1,250 @@
+"""Times the hot paths of the app on synthetic repositories of growing sizes, as JSON.
+
+Every size is a repository generated by `synthetic.py` (same columns as the sheet),
+written as a sheet and ingested like the real one, e.g.:
+
+    python benchmarks/hot_paths.py --sizes 1000 10000 --output before.json
+    python benchmarks/hot_paths.py --sizes 1000 10000 --compare before.json
+
+The results of two commits are compared case by case (the ratios of the medians).
+The widgets of the filters return scripted values (see `scripted_widgets`),
+the functions themselves run unchanged, outside of a Streamlit server.
+"""
+
+import argparse
+import atexit
+import gc
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+# the snapshots of the synthetic repositories do not end up next to the real ones
+os.environ["AIIE_CACHE_DIR"] = tempfile.mkdtemp(prefix="aiie-benchmark-")
+atexit.register(shutil.rmtree, os.environ["AIIE_CACHE_DIR"], ignore_errors=True)
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "aiie"))
+
+import streamlit as st  # noqa: E402
+import utils  # noqa: E402
+from cooccurrence import (  # noqa: E402
+    association_statistics,
+    cooccurrence_matrix,
+    is_significant,
+    top_values,
+    value_frequencies,
+)
+from data import (  # noqa: E402
+    C,
+    build_snapshot,
+    clean_data,
+    open_dataset,
+    read_repository_csv,
+)
+from embeddings import incident_features, row_signatures  # noqa: E402
+from encoding import multi_hot  # noqa: E402
+from synthetic import synthetic_repository, write_sheet  # noqa: E402
+from text_index import TrigramIndex  # noqa: E402
+from utils import (  # noqa: E402
+    category_text_filter,
+    dataframe_with_filters,
+    gen_sankey,
+    retain_most_frequent_values,
+)
+
+SIZES = [1_000, 10_000, 100_000, 1_000_000]
+
+# What the viewer typed or selected in the filters
+SEARCH = "facial, ~police"
+SELECTED = {C.country: ["USA", "UK"], C.technology: ["Machine learning"]}
+
+FILTER_COLUMNS = [C.type, C.released, C.country, C.sector, C.technology, C.risks]
+SANKEY_COLUMNS = [C.country, C.sector, C.technology]
+HEATMAP_AXES = (C.technology, C.risks)
+
+# The cases run once before being timed, e.g. the search index of the dataset
+# is built at the first search of a version, not at every rerun
+WARM_UP = {"dataframe_with_filters"}
+
+
+@contextmanager
+def scripted_widgets(values: dict):
+    """The widgets return the value scripted for their label, their default otherwise."""
+
+    def widget(default):
+        return lambda label, *args, **kwargs: values.get(label, kwargs.get("value", default))
+
+    def slider(label, *args, **kwargs):
+        return values.get(label, kwargs["value"])
+
+    with (
+        mock.patch.object(st, "text_input", widget("")),
+        mock.patch.object(st, "toggle", widget(False)),
+        mock.patch.object(st, "multiselect", widget([])),
+        mock.patch.object(st, "slider", slider),
+    ):
+        yield
+
+
+def timed(func, repeat: int, warm_up: bool = False) -> dict:
+    if warm_up:
+        func()
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return {"median_s": statistics.median(times), "min_s": min(times), "repeat": repeat}
+
+
+def heatmap(dataset, mask: np.ndarray | None, top_n: int = 20):
+    # what the interactions page computes for a heatmap
+    x, y = (dataset.multi_hot(col) for col in HEATMAP_AXES)
+    counts = cooccurrence_matrix(x, y, mask)
+    x_frequency, y_frequency = value_frequencies(x, mask), value_frequencies(y, mask)
+    n = len(dataset) if mask is None else int(mask.sum())
+    statistics = association_statistics(counts, x_frequency, y_frequency, n)
+    statistics["significant"] = is_significant(statistics["p_fisher"])
+    shown = top_values(y_frequency, top_n), top_values(x_frequency, top_n)
+    return {name: statistic.loc[shown] for name, statistic in statistics.items()}
+
+
+def cases(csv: Path) -> dict:
+    """The cases of a repository, by name."""
+    raw = read_repository_csv(csv)
+    dataset = open_dataset(build_snapshot(csv))
+    df = dataset.df
+
+    # the filters, the sankey and the values of the rows look up the dataset
+    utils.get_dataset = lambda *args, **kwargs: dataset
+    half = np.arange(len(df)) % 2 == 0
+    _, matrix, vocabulary = incident_features(dataset)
+
+    def filters():
+        with scripted_widgets({"Filter the repository on specific terms": SEARCH}):
+            return dataframe_with_filters(df, FILTER_COLUMNS)
+
+    def category_filters():
+        with scripted_widgets(SELECTED):
+            return category_text_filter(df, np.ones(len(df), dtype=bool), FILTER_COLUMNS)
+
+    mask = category_filters()
+
+    def retain_uncached():
+        retain_most_frequent_values.clear()
+        return retain_most_frequent_values(df, C.country, 10)
+
+    found = {
+        "read_repository_csv": lambda: read_repository_csv(csv),
+        "clean_data": lambda: clean_data(raw),
+        "open_dataset (snapshot)": lambda: open_dataset(build_snapshot(csv)),
+        "search index": lambda: TrigramIndex(df),
+        "dataframe_with_filters": filters,
+        "category_text_filter (no selection)": lambda: category_text_filter(
+            df, np.ones(len(df), dtype=bool), FILTER_COLUMNS
+        ),
+        "category_text_filter (selection)": category_filters,
+        "retain_most_frequent_values (miss)": retain_uncached,
+        "retain_most_frequent_values (hit)": lambda: retain_most_frequent_values(
+            df, C.country, 10
+        ),
+        "gen_sankey": lambda: gen_sankey(df, SANKEY_COLUMNS, top_n=15),
+        "gen_sankey (half of the rows)": lambda: gen_sankey(df[half], SANKEY_COLUMNS, top_n=15),
+        "multi_hot (per version)": lambda: [
+            multi_hot(dataset.values(col), len(df)) for col in HEATMAP_AXES
+        ],
+        "heatmap co-occurrence": lambda: heatmap(dataset, None),
+        "heatmap co-occurrence (filtered)": lambda: heatmap(dataset, mask & half),
+        "umap features": lambda: incident_features(dataset),
+        "umap row signatures": lambda: row_signatures(matrix, vocabulary),
+    }
+    return found
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            cwd=Path(__file__).parent,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, baseline: dict) -> pd.DataFrame:
+    """The medians of the two runs and their ratios (above 1: slower than the baseline)."""
+    rows = []
+    for size, timings in results["results"].items():
+        for name, timing in timings.items():
+            before = baseline["results"].get(size, {}).get(name, {})
+            if "median_s" in timing and "median_s" in before:
+                ratio = timing["median_s"] / before["median_s"]
+                rows.append((int(size), name, before["median_s"], timing["median_s"], ratio))
+    return pd.DataFrame(rows, columns=["rows", "case", "baseline_s", "median_s", "ratio"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--repeat", type=int, default=3, help="The median is reported.")
+    parser.add_argument("--only", nargs="+", metavar="CASE", help="Only these cases.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="Defaults to the standard output.")
+    parser.add_argument("--compare", type=Path, metavar="BASELINE", help="A previous output.")
+    args = parser.parse_args()
+
+    results = {
+        "commit": git_commit(),
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "seed": args.seed,
+        "results": {},
+    }
+
+    for rows in args.sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            csv = Path(directory) / "sheet.csv"
+            write_sheet(synthetic_repository(rows, args.seed), csv)
+
+            timings = results["results"][str(rows)] = {}
+            for name, case in cases(csv).items():
+                if args.only and name not in args.only:
+                    continue
+                timings[name] = timed(case, args.repeat, name in WARM_UP)
+                # e.g. the search index of a case is in a reference cycle (its lookup cache),
+                # at a million rows two of them do not fit in memory
+                gc.collect()
+                print(f"{rows:>9} {name:<40} {timings[name]['median_s']:.4f}s", file=sys.stderr)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        args.output.write_text(output + "\n")
+    else:
+        print(output)
+
+    if args.compare:
+        ratios = compare(results, json.loads(args.compare.read_text()))
+        print(f"\n## {results['commit']} vs the baseline\n", file=sys.stderr)
+        print(ratios.round(4).to_string(index=False), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
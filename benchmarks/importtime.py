@@ -0,0 +1,95 @@
+"""Reports the import time of the modules of the app, parsed from `python -X importtime`.
+
+Every module is imported in a fresh interpreter (from the aiie directory), e.g.:
+
+    python benchmarks/importtime.py
+    python benchmarks/importtime.py plotting embeddings --top 15
+
+The startup of the app (before the first page runs) imports what app.py imports.
+The Search page opens the description store on its first run,
+the scraping modules are imported when a row is first selected,
+the topics when their tab is first shown and the plots pages import `plotting` on their first run.
+"""
+
+import argparse
+import re
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+AIIE_DIR = Path(__file__).resolve().parents[1] / "aiie"
+
+# What is imported before a page is first shown
+SCENARIOS = {
+    "startup (app.py)": ["box", "data", "tracing", "utils"],
+    "Search page": ["descriptions"],
+    "row selected": ["scraping"],
+    "topic analysis": ["topics"],
+    "plots pages": ["plotting"],
+    "UMAP fit (worker)": ["sklearn.pipeline", "sklearn.preprocessing", "umap"],
+}
+
+# import time: self [us] | cumulative | imported package
+LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$")
+
+
+def import_times(modules: list[str]) -> pd.DataFrame:
+    """Imports the modules in a fresh interpreter.
+
+    Returns:
+        pd.DataFrame: The self and cumulative times (in ms) and the depth of every imported package
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {', '.join(modules)}"],
+        cwd=AIIE_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    rows = [
+        (match[4], int(match[1]) / 1000, int(match[2]) / 1000, len(match[3]) // 2)
+        for match in map(LINE.match, result.stderr.splitlines())
+        if match
+    ]
+    return pd.DataFrame(rows, columns=["package", "self_ms", "cumulative_ms", "depth"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("modules", nargs="*", help="Defaults to the scenarios of the app.")
+    parser.add_argument("--repeat", type=int, default=3, help="The median is reported.")
+    parser.add_argument("--top", type=int, default=10, help="The heaviest packages.")
+    args = parser.parse_args()
+
+    scenarios = {module: [module] for module in args.modules} or SCENARIOS
+
+    summary = {}
+    for name, modules in scenarios.items():
+        runs = [import_times(modules) for _ in range(args.repeat)]
+        summary[name] = statistics.median(
+            run.loc[run["depth"] == 0, "cumulative_ms"].sum() for run in runs
+        )
+
+        # the self times summed by root package do not count anything twice
+        by_package = pd.concat(
+            [
+                run.groupby(run["package"].str.split(".").str[0])["self_ms"].sum()
+                for run in runs
+            ],
+            axis=1,
+        ).median(axis=1)
+        heaviest = by_package.sort_values(ascending=False).head(args.top)
+
+        print(f"\n## {name}: import {', '.join(modules)}")
+        print(f"total {summary[name]:.0f} ms (median of {args.repeat})\n")
+        print(heaviest.rename("self ms").round(1).to_string())
+
+    print("\n## Summary\n")
+    print(pd.Series(summary, name="total ms").round(0).to_string())
+
+
+if __name__ == "__main__":
+    main()
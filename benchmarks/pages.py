@@ -0,0 +1,269 @@
+"""Times the reruns of the pages of the app, headless, with scripted interactions.
+
+The app runs in Streamlit's AppTest (no server, no browser), against a fixture sheet
+(a synthetic repository, see `synthetic.py`, or a copy of a downloaded one)
+and without network: the refresh of the sheet and the scrapers fail fast, as offline.
+
+    python benchmarks/pages.py
+    python benchmarks/pages.py Search Interactions --rows 20000 --repeat 5
+    python benchmarks/pages.py --sheet downloaded_sheet.csv --output pages.json
+
+Every rerun reports its wall time and the peak of the memory allocated meanwhile
+(traced by tracemalloc, which slows the reruns down, see --no-memory).
+With --budget, a JSON file of the seconds allowed per page, the pages
+whose scenario (median of the repeats) takes longer fail the run.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import pandas as pd
+import requests
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# the app reads the sheet and the logo from its working directory, and caches next to it
+WORKING_DIR = Path(tempfile.mkdtemp(prefix="aiie-pages-"))
+os.environ["AIIE_CACHE_DIR"] = str(WORKING_DIR / ".cache")
+sys.path.insert(0, str(ROOT / "aiie"))
+
+from streamlit.testing.v1 import AppTest  # noqa: E402
+from streamlit.util import calc_md5  # noqa: E402
+from synthetic import synthetic_repository, write_sheet  # noqa: E402
+
+# The labels of the widgets used by several pages
+SEARCH_LABEL = "Filter the repository on specific terms"
+TOP_LABEL = "Number of top values to show"
+SANKEY_LABEL = "Choose at least two columns to plot"
+FREQUENCIES_LABEL = "Select the number of top frequencies to display:"
+
+
+def interact(kind: str, label: str, method: str, *args):
+    """An interaction with a widget, e.g. interact("radio", "Cell values:", "set_value", "Lift")."""
+    return lambda at: getattr(widget(at, kind, label), method)(*args)
+
+
+def has_chart(at: AppTest) -> bool:
+    return len(at.get("plotly_chart")) > 0
+
+
+# A step: a name, the interaction before the rerun (None for the first run of the page)
+# and, optionally, a condition to rerun until (e.g. a job done in the background)
+SCENARIOS = {
+    "Search": [
+        ("open", None),
+        ("type keywords", interact("text_input", SEARCH_LABEL, "input", "facial, ~police")),
+        ("select a country", interact("multiselect", "Country(ies)", "select", "USA")),
+        (
+            "select a technology",
+            interact("multiselect", "Technology(ies)", "select", "Machine learning"),
+        ),
+        ("add a keyword", interact("text_input", SEARCH_LABEL, "input", "facial, ~police, ai")),
+        ("clear the keywords", interact("text_input", SEARCH_LABEL, "input", "")),
+    ],
+    "Timeline": [
+        ("open", None),
+        ("show more values", interact("number_input", TOP_LABEL, "set_value", 10)),
+    ],
+    "Rankings": [
+        ("open", None),
+        ("show more values", interact("number_input", TOP_LABEL, "set_value", 10)),
+    ],
+    "Sankey": [
+        ("open", None),
+        ("add a column", interact("multiselect", SANKEY_LABEL, "select", "Technology(ies)")),
+        (
+            "fewer values",
+            interact("number_input", "Number of top values per column", "set_value", 5),
+        ),
+        ("filter a column", interact("text_input", "Sector(s)", "input", "health")),
+    ],
+    "Interactions": [
+        ("open", None),
+        ("switch the X axis", interact("selectbox", "Choose X axis:", "set_value", "Issue")),
+        (
+            "switch the Y axis",
+            interact("selectbox", "Choose Y axis:", "set_value", "Transparency"),
+        ),
+        ("show the lift", interact("radio", "Cell values:", "set_value", "Lift")),
+        (
+            "only significant",
+            interact("toggle", "Only significant associations", "set_value", True),
+        ),
+        ("all the values", interact("radio", FREQUENCIES_LABEL, "set_value", "All")),
+    ],
+    "UMAP": [
+        ("open", None),
+        (
+            "generate (until plotted)",
+            interact("button", "Generate UMAP Visualization", "click"),
+            has_chart,
+        ),
+        (
+            "color by another category",
+            interact("selectbox", "Select the category to color by:", "set_value", "Sector(s)"),
+        ),
+    ],
+}
+
+# The url path of the pages (the name of the function of a page).
+# The pages of a script (e.g. About) are not run by AppTest, it has no script cache for them.
+URL_PATHS = {
+    "Search": "main",
+    "Timeline": "timeline",
+    "Rankings": "rankings",
+    "Sankey": "sankey",
+    "Interactions": "interactions",
+    "UMAP": "umap",
+}
+
+# How long a step rerunning until its condition may take, and the pause between the reruns
+UNTIL_TIMEOUT = 300
+UNTIL_POLL = 0.5
+
+
+def widget(at: AppTest, kind: str, label: str):
+    """The widget of a kind (e.g. "selectbox") with that label, wherever it is on the page."""
+    for element in getattr(at, kind):
+        if element.label == label:
+            return element
+    raise LookupError(f'No {kind} labelled "{label}"')
+
+
+def offline(*args, **kwargs):
+    raise requests.ConnectionError("The network is stubbed out by the benchmark")
+
+
+def prepare_working_dir(sheet: Path | None, rows: int, seed: int):
+    """The fixture sheet, and the logo, where the app expects them."""
+    if sheet is not None:
+        shutil.copy(sheet, WORKING_DIR / "downloaded_sheet.csv")
+    else:
+        write_sheet(synthetic_repository(rows, seed), WORKING_DIR / "downloaded_sheet.csv")
+    (WORKING_DIR / "img").symlink_to(ROOT / "img")
+    os.chdir(WORKING_DIR)
+
+
+def rerun(at: AppTest, trace_memory: bool) -> dict:
+    if trace_memory:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    at.run()
+    measure = {"wall_s": time.perf_counter() - start}
+    if trace_memory:
+        # above what was allocated before the rerun (e.g. the dataset)
+        measure["peak_mb"] = (tracemalloc.get_traced_memory()[1] - before) / 2**20
+    return measure
+
+
+def run_scenario(page: str, timeout: float, trace_memory: bool) -> list[dict]:
+    """Runs the steps of a page in a new session.
+
+    Returns:
+        list[dict]: The measures of every step, a step rerunning until
+            a condition is timed from its interaction to the condition
+    """
+    at = AppTest.from_file(str(ROOT / "aiie" / "app.py"), default_timeout=timeout)
+    at._page_hash = calc_md5(URL_PATHS[page])
+
+    measures = []
+    for step in SCENARIOS[page]:
+        name, interaction, until = (step + (None,))[:3]
+        if interaction is not None:
+            interaction(at)
+
+        started = time.perf_counter()
+        measure = rerun(at, trace_memory)
+        measure["reruns"] = 1
+        while until is not None and not until(at):
+            if time.perf_counter() - started > UNTIL_TIMEOUT:
+                raise TimeoutError(f"{page}: {name} was not done after {UNTIL_TIMEOUT}s")
+            time.sleep(UNTIL_POLL)
+            again = rerun(at, trace_memory)
+            measure["reruns"] += 1
+            if trace_memory:
+                measure["peak_mb"] = max(measure["peak_mb"], again["peak_mb"])
+        if until is not None:
+            # from the interaction to the condition, the pauses included
+            measure["wall_s"] = time.perf_counter() - started
+
+        errors = [exception.value for exception in at.exception]
+        if errors:
+            raise RuntimeError(f"{page}: {name} raised {errors[0]}")
+        measures.append({"page": page, "step": name, **measure})
+    return measures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("pages", nargs="*", metavar="PAGE", help=f"Among {', '.join(SCENARIOS)}.")
+    parser.add_argument("--sheet", type=Path, help="Defaults to a synthetic repository.")
+    parser.add_argument("--rows", type=int, default=1670, help="Of the synthetic repository.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="The median is reported.")
+    parser.add_argument("--timeout", type=float, default=120, help="Of a rerun, in seconds.")
+    parser.add_argument("--no-memory", dest="memory", action="store_false")
+    parser.add_argument("--output", type=Path, help="The measures of every rerun, as JSON.")
+    parser.add_argument("--budget", type=Path, help='e.g. {"Search": 2.0}, in seconds.')
+    args = parser.parse_args()
+    pages = args.pages or list(SCENARIOS)
+    if unknown := set(pages) - set(SCENARIOS):
+        parser.error(f"Unknown pages: {', '.join(unknown)}")
+
+    requests.Session.request = offline
+    prepare_working_dir(args.sheet and args.sheet.resolve(), args.rows, args.seed)
+    if args.memory:
+        tracemalloc.start()
+
+    # the first session of the process loads the dataset and imports the pages,
+    # it is reported apart from the others
+    measures = []
+    for repeat in range(args.repeat + 1):
+        for page in pages:
+            for measure in run_scenario(page, args.timeout, args.memory):
+                measures.append({"repeat": repeat, **measure})
+                step, wall = measure["step"], measure["wall_s"]
+                print(f"{repeat} {page:<13} {step:<30} {wall:.3f}s", file=sys.stderr)
+
+    runs = pd.DataFrame(measures)
+    first = runs[runs["repeat"] == 0].set_index(["page", "step"])
+    warm = runs[runs["repeat"] > 0].groupby(["page", "step"], sort=False)
+    summary = warm.median().drop(columns="repeat")
+    summary.insert(0, "first_wall_s", first["wall_s"])
+
+    print(f"\n## Reruns (median of {args.repeat}, after a first session)\n")
+    print(summary.round(3).to_string())
+
+    totals = runs[runs["repeat"] > 0].groupby(["page", "repeat"], sort=False)["wall_s"].sum()
+    totals = totals.groupby("page", sort=False).median()
+    print("\n## Scenarios (seconds)\n")
+    print(totals.round(3).to_string())
+
+    if args.output:
+        args.output.write_text(json.dumps({"rows": args.rows, "runs": measures}, indent=2))
+
+    shutil.rmtree(WORKING_DIR, ignore_errors=True)
+
+    if args.budget:
+        budget = json.loads(args.budget.read_text())
+        over = {
+            page: seconds
+            for page, seconds in totals.items()
+            if seconds > budget.get(page, float("inf"))
+        }
+        for page, seconds in over.items():
+            print(f"{page}: {seconds:.2f}s, over its budget of {budget[page]}s", file=sys.stderr)
+        if over:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""Compares the extraction of the incident pages before and after parsing only their useful parts.
+
+The pages are HTML files saved from the AIAAIC repository,
+or generated pages laid out like them (Google Sites), when there is none:
+
+    python benchmarks/parsing.py --download 50
+    python benchmarks/parsing.py --generate 50
+    python benchmarks/parsing.py
+
+The previous implementation (a full tree of the page, then the regexes)
+is kept below as the reference: the outputs must be equal.
+"""
+
+import argparse
+import json
+import random
+import re
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import html2text
+from bs4 import BeautifulSoup
+from markdownify import markdownify
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "aiie"))
+
+from data import C, build_snapshot, load_snapshot  # noqa: E402
+from fetch import FetchClient  # noqa: E402
+from scraping import (  # noqa: E402
+    DESCRIPTION_CLASS,
+    parse_incident_description,
+    parse_list_of_links,
+)
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures"
+
+# The pages generated when there is no saved one
+DEFAULT_GENERATED = 30
+
+WORDS = (
+    "the algorithm system model data users police facial recognition company accused "
+    "privacy bias report investigation researchers found automated decisions students "
+    "drivers workers chatbot generated images deepfake voice claims lawsuit regulator"
+).split()
+
+
+def reference_incident_description(html: str) -> str:
+    soup = BeautifulSoup(html, "html.parser")
+    description = soup.find_all(class_=DESCRIPTION_CLASS)
+
+    description = markdownify("\n".join((str(i) for i in description[1:-1])))
+    description = re.sub(r"^(#+)\s+(.*)", r"#### \2", description)
+    description = description.replace(
+        "](/aiaaic-repository", "](https://www.aiaaic.org/aiaaic-repository"
+    )
+    return description.replace("### ", "##### ")
+
+
+def reference_list_of_links(html: str) -> list[str]:
+    soup = BeautifulSoup(html, "html.parser")
+    section = soup.find(string=re.compile(", commentar")) or soup.find(
+        string=re.compile("act check 🚩")
+    )
+    if not section:
+        return []
+
+    urls = []
+    for li in section.find_next("ul").find_all("li"):
+        match = re.search(r"\[([^][]*)\]\(([^()]*)\)", html2text.html2text(str(li)))
+        if match:
+            urls.append(match.group(2))
+    return urls
+
+
+def download_fixtures(csv: str, n: int, directory: Path):
+    """Saves the pages of the first n incidents of the downloaded sheet."""
+    directory.mkdir(parents=True, exist_ok=True)
+    links = load_snapshot(build_snapshot(csv))[C.summary_links].dropna()
+    client = FetchClient()
+    for i, url in enumerate(links[links.str.startswith("http")].iloc[:n]):
+        response = client.get(url)
+        (directory / f"{i:04d}.html").write_text(response.text, encoding="utf-8")
+        time.sleep(0.5)
+
+
+def sentence(rng: random.Random, n_words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(n_words)).capitalize() + "."
+
+
+def generate_page(rng: random.Random, i: int) -> str:
+    """An incident page laid out like the ones of the repository (a Google Sites page).
+
+    The description blocks are among large scripts and navigation links,
+    their list of sources follows a "commentaries" or a "Fact check 🚩" text,
+    sometimes entity-encoded (the whole page is then parsed) or with nested lists.
+    """
+
+    def block(content: str) -> str:
+        return f'<div class="{DESCRIPTION_CLASS}"><div class="tyJCtd">{content}</div></div>'
+
+    def link(text: str) -> str:
+        if rng.random() < 0.3:
+            href = f"/aiaaic-repository/ai-algorithmic-and-automation-incidents/{rng.choice(WORDS)}-{i}"
+        else:
+            href = f"https://www.{rng.choice(WORDS)}.com/{rng.randrange(10**6)}"
+        return f'<a class="XqQF9c" href="{href}" target="_blank">{text}</a>'
+
+    def paragraph() -> str:
+        words = [sentence(rng, rng.randint(8, 25)) for _ in range(rng.randint(2, 5))]
+        words.insert(rng.randrange(len(words)), link(sentence(rng, 3)))
+        return f'<p dir="ltr" class="zfr3Q CDt4Ke"><span class="C9DxTc">{" ".join(words)}</span></p>'
+
+    def sources() -> str:
+        items = [
+            f'<li class="zfr3Q TYR86d"><p class="zfr3Q CDt4Ke">{link(sentence(rng, 6))}</p></li>'
+            for _ in range(rng.randint(3, 15))
+        ]
+        if rng.random() < 0.2:
+            # a nested list, its links are sources too
+            items[0] = items[0][: -len("</li>")] + f"<ul>{''.join(items[1:3])}</ul></li>"
+        marker = rng.choice(
+            ["News, commentaries, analyses 📣", "Fact check 🚩", "News&#44; commentaries, analyses"]
+        )
+        return f'<p class="zfr3Q CDt4Ke"><span>{marker}</span></p><ul class="n8H08c">{"".join(items)}</ul>'
+
+    blocks = [block('<p class="zfr3Q">AIAAIC Repository</p>')]
+    blocks.append(block(f'<h1 class="zfr3Q duRjpb">{sentence(rng, 6)}</h1>'))
+    blocks += [block(paragraph()) for _ in range(rng.randint(2, 6))]
+    for heading in rng.sample(["Operator", "Developer", "System", "Technology", "Issue"], 3):
+        blocks.append(block(f'<h3 class="zfr3Q">{heading}</h3>{paragraph()}'))
+    blocks.append(block(sources()))
+    blocks.append(block(f"<p>{link('Related incidents')}</p>"))
+    blocks.append(block('<p class="zfr3Q">Page info Type: Incident Published: 2024</p>'))
+
+    # the scripts and the navigation make most of the size of a real page
+    state = json.dumps([[rng.random(), sentence(rng, 10)] for _ in range(rng.randint(500, 1500))])
+    navigation = "".join(
+        f'<li><a href="/aiaaic-repository/{rng.choice(WORDS)}-{n}">{sentence(rng, 2)}</a></li>'
+        for n in range(300)
+    )
+    return (
+        '<!DOCTYPE html><html lang="en-US"><head><meta charset="utf-8">'
+        f"<script nonce=\"x\">window.WIZ_global_data = {state};</script></head>"
+        f'<body><nav><ul class="jYxBte">{navigation}</ul></nav>'
+        f'<div role="main" class="UtePc">{"".join(blocks)}</div></body></html>'
+    )
+
+
+def generate_fixtures(n: int, directory: Path, seed: int = 0):
+    """Saves n generated pages (always the same ones)."""
+    directory.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(seed)
+    for i in range(n):
+        (directory / f"generated-{i:04d}.html").write_text(
+            generate_page(rng, i), encoding="utf-8"
+        )
+
+
+def timed(func, html: str, repeat: int):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(html)
+        times.append(time.perf_counter() - start)
+    return result, min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fixtures", type=Path, default=FIXTURES_DIR)
+    parser.add_argument("--download", type=int, metavar="N", help="Save N pages first.")
+    parser.add_argument("--generate", type=int, metavar="N", help="Generate N pages first.")
+    parser.add_argument("--csv", default="downloaded_sheet.csv", help="The downloaded sheet.")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.download:
+        download_fixtures(args.csv, args.download, args.fixtures)
+    if args.generate:
+        generate_fixtures(args.generate, args.fixtures)
+
+    pages = sorted(args.fixtures.glob("*.html"))
+    if not pages:
+        print(f"No HTML page in {args.fixtures}, generating {DEFAULT_GENERATED} of them")
+        generate_fixtures(DEFAULT_GENERATED, args.fixtures)
+        pages = sorted(args.fixtures.glob("*.html"))
+
+    functions = {
+        "description": (reference_incident_description, parse_incident_description),
+        "links": (reference_list_of_links, parse_list_of_links),
+    }
+    totals = {name: [0.0, 0.0] for name in functions}
+    speedups = {name: [] for name in functions}
+    different = {name: [] for name in functions}
+
+    for path in pages:
+        html = path.read_text(encoding="utf-8")
+        for name, (reference, optimized) in functions.items():
+            expected, old = timed(reference, html, args.repeat)
+            result, new = timed(optimized, html, args.repeat)
+            totals[name][0] += old
+            totals[name][1] += new
+            speedups[name].append(old / new)
+            if result != expected:
+                different[name].append(path.name)
+
+    print(f"{len(pages)} pages, best of {args.repeat}")
+    for name, (old, new) in totals.items():
+        print(
+            f"{name:>12}: {old * 1000:8.1f}ms -> {new * 1000:8.1f}ms"
+            f" (x{old / new:.1f}, median x{statistics.median(speedups[name]):.1f}),"
+            f" {len(pages) - len(different[name])}/{len(pages)} equal"
+        )
+        for page in different[name]:
+            print(f"{'':>14}different: {page}")
+
+    if any(different.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""Generates synthetic repositories shaped like the AIAAIC sheet, at any number of rows.
+
+The columns are the ones of `data.C`, the multi-valued cells follow Zipf distributions
+calibrated on the real sheet (~1.7k rows): a few values (e.g. USA, Machine learning)
+are in most of the rows, the long tail grows with the number of rows (e.g. the deployers).
+Some cells use the spellings merged by the taxonomy, as in the real sheet.
+
+    python benchmarks/synthetic.py 100000 --output synthetic.csv
+"""
+
+import argparse
+import sys
+from collections import namedtuple
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "aiie"))
+
+from data import SEMICOLON_SEPARATED, C  # noqa: E402
+from taxonomy import load_taxonomy  # noqa: E402
+
+# The number of rows the distributions were calibrated on
+REFERENCE_ROWS = 1670
+
+# vocabulary: distinct values at REFERENCE_ROWS, growth: exponent of its growth with the rows,
+# exponent: of the Zipf distribution, per_row: mean number of values, empty: share of empty cells
+Distribution = namedtuple(
+    "Distribution", ["name", "vocabulary", "growth", "exponent", "per_row", "empty"]
+)
+
+DISTRIBUTIONS = {
+    C.country: Distribution("Country", 102, 0.2, 1.6, 1.2, 0.0),
+    C.sector: Distribution("Sector", 62, 0.1, 0.9, 1.1, 0.0),
+    C.operator: Distribution("Deployer", 1232, 0.8, 0.7, 1.2, 0.2),
+    C.developer: Distribution("Developer", 852, 0.8, 0.8, 1.13, 0.1),
+    C.system_name: Distribution("System", 1300, 0.9, 0.5, 1.1, 0.15),
+    C.technology: Distribution("Technology", 220, 0.3, 1.0, 2.4, 0.05),
+    C.purpose: Distribution("Purpose", 850, 0.8, 0.7, 1.17, 0.01),
+    C.media_trigger: Distribution("Media trigger", 223, 0.4, 1.1, 0.86, 0.15),
+    C.risks: Distribution("Issue", 180, 0.3, 1.0, 2.0, 0.01),
+    C.transparency: Distribution("Transparency", 20, 0.0, 1.2, 1.35, 0.22),
+}
+
+# The most frequent values of the real sheet
+HEADS = {
+    C.country: ["USA", "UK", "China", "India", "Global", "Canada", "Australia", "France"],
+    C.sector: ["Media/entertainment/sports/arts", "Technology", "Politics", "Govt - police"],
+    C.technology: ["Machine learning", "Deep learning", "Neural networks", "Chatbot"],
+    C.risks: ["Accuracy/reliability", "Privacy", "Safety", "Ethics/values"],
+    C.transparency: ["Governance", "Marketing", "Black box", "Complaints/appeals"],
+    C.operator: ["Meta", "Google", "Amazon", "OpenAI", "Microsoft", "Tesla"],
+    C.developer: ["Google", "OpenAI", "Meta", "Microsoft", "Amazon", "Clearview AI"],
+    C.system_name: ["ChatGPT", "Facebook", "YouTube", "Autopilot", "Rekognition"],
+    C.media_trigger: ["Media investigation", "Research study", "Lawsuit filing"],
+}
+
+TYPES = {"Incident": 0.65, "Issue": 0.24, "System": 0.08, "Data": 0.03}
+EMPTY_TYPES = 0.11
+
+# The words of the headlines, the first ones being the most frequent
+WORDS = (
+    "ai algorithm facial recognition police chatbot deepfake bias data privacy "
+    "driverless car crash students exam grading hiring tool women misidentifies "
+    "man wrongful arrest voice clone scam content moderation removes posts "
+    "predictive policing welfare fraud detection wrongly accuses families "
+    "generated images copyright lawsuit surveillance cameras school children "
+    "health insurance denies claims translation errors asylum seekers"
+).split()
+
+
+def vocabulary(col: str, rows: int) -> np.ndarray:
+    """The values of a column, most frequent first."""
+    distribution = DISTRIBUTIONS[col]
+    size = max(2, round(distribution.vocabulary * (rows / REFERENCE_ROWS) ** distribution.growth))
+
+    # then the merged values of the taxonomy, then their other spellings
+    synonyms = load_taxonomy().synonyms.get(col, {})
+    head = list(dict.fromkeys(HEADS.get(col, []) + list(synonyms.values())))
+    head += [value for value in synonyms if value not in {v.casefold() for v in head}]
+
+    tail = [f"{distribution.name} {i}" for i in range(len(head), size)]
+    return np.array((head + tail)[:size], dtype=object)
+
+
+def zipf_probabilities(size: int, exponent: float) -> np.ndarray:
+    weights = 1 / np.arange(1, size + 1) ** exponent
+    return weights / weights.sum()
+
+
+def multi_valued_cells(rng, col: str, rows: int) -> np.ndarray:
+    """The cells of a multi-valued column, e.g. "USA, UK", separated by commas or semicolons.
+
+    The values of the columns whose own values may have commas are only separated by semicolons.
+    """
+    distribution = DISTRIBUTIONS[col]
+    values = vocabulary(col, rows)
+    probabilities = zipf_probabilities(len(values), distribution.exponent)
+
+    # the number of values of every (non-empty) cell, at least one
+    per_cell = distribution.per_row / max(1 - distribution.empty, 1e-9)
+    counts = np.minimum(1 + rng.poisson(max(per_cell - 1, 0), rows), 8)
+    counts[rng.random(rows) < distribution.empty] = 0
+
+    cells = np.full(rows, np.nan, dtype=object)
+    comma = 0.0 if col in SEMICOLON_SEPARATED else 0.8
+    separators = np.where(rng.random(rows) < comma, ", ", "; ").astype(object)
+    for position in range(counts.max(initial=0)):
+        rows_with = np.flatnonzero(counts > position)
+        drawn = values[rng.choice(len(values), rows_with.size, p=probabilities)]
+        if position == 0:
+            cells[rows_with] = drawn
+        else:
+            cells[rows_with] = cells[rows_with] + separators[rows_with] + drawn
+    return cells
+
+
+def years(rng, rows: int, missing: float) -> np.ndarray:
+    """The years as written in the sheet: "2019", sometimes "2018-2019" or "2019; 2021"."""
+    first = rng.choice(np.arange(2010, 2025), rows, p=zipf_probabilities(15, 0.8)[::-1])
+    cells = first.astype(str).astype(object)
+
+    kind = rng.random(rows)
+    ranges, lists = kind < 0.05, (kind >= 0.05) & (kind < 0.08)
+    cells[ranges] = cells[ranges] + "-" + (first[ranges] + 1).astype(str)
+    cells[lists] = cells[lists] + "; " + (first[lists] + 2).astype(str)
+    cells[rng.random(rows) < missing] = np.nan
+    return cells
+
+
+def headlines(rng, rows: int, deployers: np.ndarray) -> np.ndarray:
+    """E.g. "Meta chatbot police bias data", about 50 characters like the real ones."""
+    words = np.array(WORDS, dtype=object)
+    probabilities = zipf_probabilities(len(words), 0.8)
+    cells = pd.Series(deployers).fillna("Unknown").str.split(r"[,;] ").str[0].to_numpy()
+    for _ in range(5):
+        cells = cells + " " + words[rng.choice(len(words), rows, p=probabilities)]
+    return cells
+
+
+def synthetic_repository(rows: int, seed: int = 0) -> pd.DataFrame:
+    """A raw repository, as read from the sheet (before `data.clean_data`).
+
+    Args:
+        rows (int): The number of incidents
+        seed (int, optional): The same seed gives the same repository. Defaults to 0.
+    Returns:
+        pd.DataFrame: The ID column followed by the columns of `data.C`
+    """
+    rng = np.random.default_rng(seed)
+
+    df = pd.DataFrame({"AIAAIC ID#": [f"AIAAIC{i:07d}" for i in range(rows)]})
+    cells = {col: multi_valued_cells(rng, col, rows) for col in DISTRIBUTIONS}
+
+    types = rng.choice(list(TYPES), rows, p=list(TYPES.values())).astype(object)
+    types[rng.random(rows) < EMPTY_TYPES] = np.nan
+
+    for col in C:
+        if col == C.title:
+            df[col] = headlines(rng, rows, cells[C.operator])
+        elif col == C.type:
+            df[col] = types
+        elif col in (C.released, C.occurred):
+            df[col] = years(rng, rows, missing=0.3 if col == C.released else 0.05)
+        elif col == C.summary_links:
+            df[col] = "https://www.aiaaic.org/aiaaic-repository/incident-" + df["AIAAIC ID#"]
+        else:
+            df[col] = cells[col]
+    return df
+
+
+def write_sheet(df: pd.DataFrame, filename):
+    """Writes the repository like the downloaded sheet: a title row above the header, a sub-header below."""
+    with open(filename, "w", encoding="utf-8", newline="") as file:
+        file.write("AIAAIC Repository (synthetic)" + "," * (len(df.columns) - 1) + "\n")
+        file.write(",".join(df.columns) + "\n")
+        file.write("," * (len(df.columns) - 1) + "\n")
+        df.to_csv(file, header=False, index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("rows", type=int)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="synthetic_sheet.csv")
+    args = parser.parse_args()
+
+    write_sheet(synthetic_repository(args.rows, args.seed), args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Measures the first and the warm UMAP fits of a process, with and without the warmup and the numba disk cache.
+
+Every scenario runs in a fresh interpreter, like a job worker after a deploy:
+
+    python benchmarks/umap_warmup.py
+    python benchmarks/umap_warmup.py --rows 1700 --features 400
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+AIIE_DIR = Path(__file__).resolve().parents[1] / "aiie"
+
+
+def synthetic_features(rows: int, features: int, density: float = 0.02) -> sp.csr_matrix:
+    """A multi-hot matrix shaped like the UMAP features of the incidents."""
+    rng = np.random.default_rng(0)
+    return sp.csr_matrix((rng.random((rows, features)) < density).astype(float))
+
+
+def child(args):
+    # the cache directory is set by the parent, before numba is imported
+    start = time.perf_counter()
+    sys.path.insert(0, str(AIIE_DIR))
+    from embeddings import fit_embedding, warm_up_umap
+
+    timings = {}
+    if args.warmup:
+        timings["warmup_s"] = warm_up_umap()
+
+    matrix = synthetic_features(args.rows, args.features)
+    for call in ["first_fit_s", "warm_fit_s"]:
+        start_call = time.perf_counter()
+        fit_embedding(matrix, n_neighbors=15)
+        timings[call] = time.perf_counter() - start_call
+    timings["process_s"] = time.perf_counter() - start
+    print(json.dumps(timings))
+
+
+def run(cache_dir: str, warmup: bool, args) -> dict:
+    command = [sys.executable, __file__, "--child", "--rows", str(args.rows)]
+    command += ["--features", str(args.features)] + (["--warmup"] if warmup else [])
+    result = subprocess.run(
+        command,
+        env={**os.environ, "NUMBA_CACHE_DIR": cache_dir},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--features", type=int, default=300)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--warmup", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return child(args)
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        results = {
+            "cold (empty numba cache)": run(cache_dir, False, args),
+            "numba disk cache": run(cache_dir, False, args),
+            "numba disk cache + warmup": run(cache_dir, True, args),
+        }
+
+    print(f"{args.rows} x {args.features} multi-hot features, n_neighbors=15\n")
+    print(pd.DataFrame(results).T.round(2).to_string())
+
+
+if __name__ == "__main__":
+    main()
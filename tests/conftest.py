@@ -0,0 +1,71 @@
+import os
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+# the derived artifacts of the tests do not end up next to the real ones
+os.environ.setdefault("AIIE_CACHE_DIR", tempfile.mkdtemp(prefix="aiie-tests-"))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "aiie"))
+
+
+class FixtureServer:
+    """A local stand-in for the upstream hosts, serving the responses set per path.
+
+    A route is a (status, headers, body) tuple, or a function of the request
+    (its handler) returning one. Every request is recorded with its headers.
+    """
+
+    def __init__(self):
+        self.routes = {}
+        self.requests = []
+        self.lock = threading.Lock()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with server.lock:
+                    server.requests.append((self.path, dict(self.headers)))
+                route = server.routes.get(self.path, (404, {}, b""))
+                status, headers, body = route(self) if callable(route) else route
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def url(self, path: str) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_port}{path}"
+
+    def requested(self, path: str) -> list[dict]:
+        """The headers of the requests of a path."""
+        with self.lock:
+            return [headers for requested, headers in self.requests if requested == path]
+
+
+@pytest.fixture
+def fixture_server():
+    server = FixtureServer()
+    server.thread.start()
+    yield server
+    server.httpd.shutdown()
+    server.httpd.server_close()
+
+
+@pytest.fixture(scope="session")
+def dataset():
+    """The dataset of the fixture sheet (the first rows of a downloaded one)."""
+    from data import build_snapshot, open_dataset
+
+    return open_dataset(build_snapshot(Path(__file__).parent / "fixtures" / "sheet.csv"))
@@ -0,0 +1,119 @@
+import numpy as np
+import pandas as pd
+import pytest
+from cooccurrence import (
+    association_statistics,
+    cooccurrence_matrix,
+    is_significant,
+    top_values,
+    value_frequencies,
+)
+from data import C
+from encoding import MultiHot
+from scipy import stats
+from scipy.sparse import csr_matrix
+
+AXES = [(C.technology, C.risks), (C.sector, C.technology), (C.country, C.country)]
+
+
+def dense(dataset, col) -> pd.DataFrame:
+    # the 0/1 columns the plots used to build, one per value
+    encoding = dataset.multi_hot(col)
+    return pd.DataFrame(encoding.matrix.toarray(), columns=encoding.vocabulary)
+
+
+@pytest.fixture(scope="module")
+def masks(dataset):
+    rng = np.random.default_rng(0)
+    return [None, rng.random(len(dataset)) < 0.5, np.zeros(len(dataset), dtype=bool)]
+
+
+@pytest.mark.parametrize("x_col, y_col", AXES)
+def test_cooccurrence_matrix(dataset, masks, x_col, y_col):
+    x, y = dense(dataset, x_col), dense(dataset, y_col)
+    for mask in masks:
+        rows = slice(None) if mask is None else mask
+        # the loop of the heatmap it replaced
+        expected = pd.DataFrame(0, index=y.columns, columns=x.columns)
+        for y_value in y.columns:
+            for x_value in x.columns:
+                expected.loc[y_value, x_value] = np.logical_and(
+                    y[y_value][rows] == 1, x[x_value][rows] == 1
+                ).sum()
+
+        counts = cooccurrence_matrix(dataset.multi_hot(x_col), dataset.multi_hot(y_col), mask)
+        pd.testing.assert_frame_equal(counts, expected, check_dtype=False)
+
+
+@pytest.mark.parametrize("col", [C.technology, C.risks])
+def test_value_frequencies(dataset, masks, col):
+    values = dense(dataset, col)
+    for mask in masks:
+        expected = values.sum() if mask is None else values[mask].sum()
+        pd.testing.assert_series_equal(
+            value_frequencies(dataset.multi_hot(col), mask), expected, check_dtype=False
+        )
+
+
+def test_top_values():
+    frequency = pd.Series([3, 1, 3, 2], index=["a", "b", "c", "d"])
+    assert list(top_values(frequency, 2)) == ["a", "c"]
+    assert list(top_values(frequency, "All")) == ["a", "c", "d", "b"]
+
+
+
+N = 300
+
+
+@pytest.fixture(scope="module")
+def association():
+    rng = np.random.default_rng(0)
+    x = (rng.random((N, 6)) < 0.3).astype(np.int32)
+    y = (rng.random((N, 5)) < 0.2).astype(np.int32)
+    # a pair much more frequent than by chance
+    x[:60, 0] = y[:60, 0] = 1
+    x, y = (
+        MultiHot(csr_matrix(m), np.array([f"v{i}" for i in range(m.shape[1])], dtype=object))
+        for m in (x, y)
+    )
+
+    counts = cooccurrence_matrix(x, y)
+    x_frequency, y_frequency = value_frequencies(x), value_frequencies(y)
+    return counts, x_frequency, y_frequency, association_statistics(
+        counts, x_frequency, y_frequency, N
+    )
+
+
+def test_association_statistics(association):
+    counts, x_frequency, y_frequency, measures = association
+    for (y_value, x_value), a in counts.stack().items():
+        r, k = y_frequency[y_value], x_frequency[x_value]
+        table = [[a, r - a], [k - a, N - r - k + a]]
+        measure = {name: values.loc[y_value, x_value] for name, values in measures.items()}
+
+        chi2 = stats.chi2_contingency(table, correction=False)
+        assert measure["chi2"] == pytest.approx(chi2.statistic)
+        assert measure["p_chi2"] == pytest.approx(chi2.pvalue)
+        fisher = stats.fisher_exact(table, alternative="greater")
+        assert measure["p_fisher"] == pytest.approx(fisher.pvalue)
+
+        p_xy, p_x, p_y = a / N, k / N, r / N
+        assert measure["lift"] == pytest.approx(p_xy / (p_x * p_y))
+        if a:
+            assert measure["npmi"] == pytest.approx(np.log(p_xy / (p_x * p_y)) / -np.log(p_xy))
+        else:
+            assert measure["npmi"] == -1
+
+    assert measures["p_fisher"].loc["v0", "v0"] < 1e-5
+
+
+def test_is_significant(association):
+    p_values = association[3]["p_fisher"]
+
+    # Benjamini-Hochberg: the k smallest p-values, for the largest k with p_(k) <= k/m * alpha
+    p = np.sort(p_values.to_numpy().ravel())
+    below = np.flatnonzero(p <= np.arange(1, p.size + 1) / p.size * 0.05)
+    threshold = p[below[-1]] if below.size else -1
+    significant = is_significant(p_values)
+    pd.testing.assert_frame_equal(significant, p_values <= threshold)
+    assert significant.loc["v0", "v0"]
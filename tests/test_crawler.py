@@ -0,0 +1,137 @@
+import time
+
+import crawler
+import pytest
+from crawler import HostRateLimiter, crawl
+from descriptions import DescriptionStore
+from scraping import DESCRIPTION_CLASS
+
+ETAG = '"v1"'
+
+
+def page(description: str, links: list[str]) -> bytes:
+    # the first and the last description blocks are the header and the footer of the site
+    blocks = "".join(
+        f'<div class="{DESCRIPTION_CLASS}">{block}</div>'
+        for block in ["Header", f"<p>{description}</p>", "Footer"]
+    )
+    items = "".join(f'<li><a href="{link}">Source</a></li>' for link in links)
+    html = f"<html><body>{blocks}<p>News, commentaries, analyses</p><ul>{items}</ul></body></html>"
+    return html.encode()
+
+
+@pytest.fixture
+def store(tmp_path):
+    return DescriptionStore(tmp_path / "descriptions.sqlite")
+
+
+def fetched_at(store, incident_id):
+    return store.connection().execute(
+        "SELECT fetched_at FROM descriptions WHERE id = ?", (incident_id,)
+    ).fetchone()[0]
+
+
+def test_crawl(fixture_server, store):
+    pages = {}
+    for i in range(5):
+        fixture_server.routes[f"/{i}"] = (
+            200,
+            {"ETag": f'"{i}"'},
+            page(f"Incident {i}", [f"https://example.org/{i}/a", f"https://example.org/{i}/b"]),
+        )
+        pages[f"AIAAIC{i}"] = fixture_server.url(f"/{i}")
+
+    stats = crawl(pages.items(), store, concurrency=3, rate=1000, backoff=0)
+
+    assert stats == {"fetched": 5}
+    assert store.get(pages).sort_index().to_dict() == {
+        f"AIAAIC{i}": f"Incident {i}\n\n" for i in range(5)
+    }
+    assert store.get_links("AIAAIC3") == ["https://example.org/3/a", "https://example.org/3/b"]
+    assert store.validators(["AIAAIC3"]) == {"AIAAIC3": (pages["AIAAIC3"], '"3"', None)}
+    assert store.search("incident").sort_values().tolist() == sorted(pages)
+
+
+def test_not_modified(fixture_server, store, monkeypatch):
+    def conditional(request):
+        if request.headers.get("If-None-Match") == ETAG:
+            return 304, {}, b""
+        return 200, {"ETag": ETAG}, page("Unchanged", ["https://example.org"])
+
+    fixture_server.routes["/page"] = conditional
+    pages = [("AIAAIC1", fixture_server.url("/page"))]
+    crawl(pages, store, rate=1000, backoff=0)
+    first = fetched_at(store, "AIAAIC1")
+
+    def put_many(rows):
+        raise AssertionError("The description of an unchanged page was replaced")
+
+    monkeypatch.setattr(store, "put_many", put_many)
+    time.sleep(0.01)
+    assert crawl(pages, store, rate=1000, backoff=0) == {"not modified": 1}
+
+    assert fixture_server.requested("/page")[-1]["If-None-Match"] == ETAG
+    assert fetched_at(store, "AIAAIC1") > first
+    assert store.get(["AIAAIC1"]).tolist() == ["Unchanged\n\n"]
+    assert store.get_links("AIAAIC1") == ["https://example.org"]
+
+
+def test_validators_of_another_url_are_not_sent(fixture_server, store):
+    fixture_server.routes["/old"] = (200, {"ETag": ETAG}, page("Old", []))
+    fixture_server.routes["/new"] = (200, {}, page("New", []))
+    crawl([("AIAAIC1", fixture_server.url("/old"))], store, rate=1000, backoff=0)
+
+    assert crawl([("AIAAIC1", fixture_server.url("/new"))], store, rate=1000) == {"fetched": 1}
+    assert "If-None-Match" not in fixture_server.requested("/new")[0]
+    assert store.get(["AIAAIC1"]).tolist() == ["New\n\n"]
+
+
+def test_server_errors_are_retried(fixture_server, store):
+    statuses = iter([503, 502])
+
+    def flaky(request):
+        status = next(statuses, 200)
+        return status, {}, page("Eventually", []) if status == 200 else b""
+
+    fixture_server.routes["/flaky"] = flaky
+    fixture_server.routes["/down"] = (500, {}, b"")
+    pages = [("AIAAIC1", fixture_server.url("/flaky")), ("AIAAIC2", fixture_server.url("/down"))]
+
+    assert crawl(pages, store, rate=1000, retries=3, backoff=0) == {"fetched": 1, "failed": 1}
+    assert len(fixture_server.requested("/flaky")) == 3
+    assert len(fixture_server.requested("/down")) == 4
+    assert store.get(["AIAAIC1", "AIAAIC2"]).to_dict() == {"AIAAIC1": "Eventually\n\n"}
+
+
+def test_rate_limit(fixture_server, store):
+    times = []
+
+    def timed(request):
+        times.append(time.monotonic())
+        return 200, {}, page("Timed", [])
+
+    pages = []
+    for i in range(6):
+        fixture_server.routes[f"/{i}"] = timed
+        pages.append((f"AIAAIC{i}", fixture_server.url(f"/{i}")))
+
+    # concurrent fetches, but 20 requests per second at most
+    crawl(pages, store, concurrency=6, rate=20, backoff=0)
+    times.sort()
+    # (the arrival times jitter a bit, but without the limit they would all be at once)
+    assert min(after - before for before, after in zip(times, times[1:])) > 0.025
+    assert times[-1] - times[0] >= 5 * 0.05 - 0.01
+
+
+def test_rate_limit_per_host(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(crawler.time, "sleep", sleeps.append)
+    limiter = HostRateLimiter(rate=2)
+
+    for url in ["http://a.org/1", "http://b.org/1", "http://a.org/2", "http://a.org/3"]:
+        limiter.wait(url)
+
+    # the second request to a waits one interval, the third two, b is not held back
+    assert sleeps[:2] == [0, 0]
+    assert sleeps[2] == pytest.approx(0.5, abs=0.01)
+    assert sleeps[3] == pytest.approx(1.0, abs=0.01)
@@ -0,0 +1,150 @@
+import json
+import os
+from pathlib import Path
+
+import data
+import pytest
+import requests
+from fetch import CircuitBreaker, FetchClient
+
+SHEET = (Path(__file__).parent / "fixtures" / "sheet.csv").read_bytes()
+VALIDATORS = {"ETag": '"v1"', "Last-Modified": "Mon, 19 Aug 2024 10:00:00 GMT"}
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(data, "CACHE_DIR", tmp_path / "cache")
+    monkeypatch.setattr(data, "SNAPSHOT_DIR", tmp_path / "cache" / "snapshots")
+
+
+@pytest.fixture
+def client():
+    return FetchClient(retries=1, backoff=0, breaker=CircuitBreaker(threshold=100))
+
+
+@pytest.fixture
+def sheet(tmp_path):
+    return str(tmp_path / "downloaded_sheet.csv")
+
+
+def conditional(request):
+    # a server honouring the validators it issued
+    if request.headers.get("If-None-Match") == VALIDATORS["ETag"]:
+        return 304, {}, b""
+    return 200, VALIDATORS, SHEET
+
+
+def test_download(fixture_server, client, sheet):
+    fixture_server.routes["/sheet.csv"] = (200, VALIDATORS, SHEET)
+
+    url = fixture_server.url("/sheet.csv")
+    assert data.download_public_sheet_as_csv(url, sheet, client=client)
+
+    with open(sheet, "rb") as f:
+        assert f.read() == SHEET
+    meta = json.loads((data.CACHE_DIR / "downloaded_sheet.csv.meta.json").read_text())
+    assert meta["etag"] == VALIDATORS["ETag"]
+    assert meta["last_modified"] == VALIDATORS["Last-Modified"]
+    assert meta["digest"] == data.file_digest(sheet)
+
+
+def test_not_modified(fixture_server, client, sheet):
+    fixture_server.routes["/sheet.csv"] = conditional
+    url = fixture_server.url("/sheet.csv")
+    data.download_public_sheet_as_csv(url, sheet, client=client)
+    mtime = os.stat(sheet).st_mtime_ns
+
+    assert not data.download_public_sheet_as_csv(url, sheet, client=client)
+
+    first, second = fixture_server.requested("/sheet.csv")
+    assert "If-None-Match" not in first
+    assert second["If-None-Match"] == VALIDATORS["ETag"]
+    assert second["If-Modified-Since"] == VALIDATORS["Last-Modified"]
+    assert os.stat(sheet).st_mtime_ns == mtime
+
+
+def test_validators_of_another_file_are_not_sent(fixture_server, client, sheet):
+    fixture_server.routes["/sheet.csv"] = conditional
+    url = fixture_server.url("/sheet.csv")
+    data.download_public_sheet_as_csv(url, sheet, client=client)
+    with open(sheet, "ab") as f:
+        f.write(b"edited by hand\n")
+
+    assert data.download_public_sheet_as_csv(url, sheet, client=client)
+    assert "If-None-Match" not in fixture_server.requested("/sheet.csv")[-1]
+
+
+def test_unchanged_content_is_not_rebuilt(fixture_server, client, sheet, monkeypatch):
+    # a server ignoring the validators: the content hash is compared
+    fixture_server.routes["/sheet.csv"] = (200, {}, SHEET)
+    url = fixture_server.url("/sheet.csv")
+    assert data.refresh_repository_data(url, sheet, client=client)
+    snapshot = data.build_snapshot(sheet)
+
+    def build_snapshot(*args):
+        raise AssertionError("The snapshot of an unchanged sheet was rebuilt")
+
+    monkeypatch.setattr(data, "build_snapshot", build_snapshot)
+    assert not data.refresh_repository_data(url, sheet, client=client)
+    assert snapshot.exists()
+
+
+def test_replaced_atomically(fixture_server, client, sheet, monkeypatch):
+    with open(sheet, "wb") as f:
+        f.write(b"previous version\n")
+    fixture_server.routes["/sheet.csv"] = (200, {}, SHEET)
+
+    replaced = []
+    replace = os.replace
+
+    def spy(src, dst):
+        if os.fspath(dst) == sheet:
+            # the new version is complete before it replaces the previous one
+            with open(src, "rb") as new, open(dst, "rb") as previous:
+                replaced.append((new.read(), previous.read()))
+        replace(src, dst)
+
+    monkeypatch.setattr(os, "replace", spy)
+    data.download_public_sheet_as_csv(fixture_server.url("/sheet.csv"), sheet, client=client)
+
+    assert replaced == [(SHEET, b"previous version\n")]
+    assert [name for name in os.listdir(os.path.dirname(sheet)) if name.endswith(".tmp")] == []
+
+
+def test_failed_download_keeps_the_snapshot(fixture_server, client, sheet):
+    url = fixture_server.url("/sheet.csv")
+    fixture_server.routes["/sheet.csv"] = (200, {}, SHEET)
+    data.refresh_repository_data(url, sheet, client=client)
+    snapshot = data.build_snapshot(sheet)
+
+    fixture_server.routes["/sheet.csv"] = (503, {}, b"")
+    with pytest.raises(requests.HTTPError):
+        data.refresh_repository_data(url, sheet, client=client)
+
+    with open(sheet, "rb") as f:
+        assert f.read() == SHEET
+    assert data.build_snapshot(sheet) == snapshot
+    assert len(data.open_dataset(snapshot)) == 12
+
+
+def test_refresh_thread_survives_a_failure(fixture_server, client, sheet, monkeypatch):
+    fixture_server.routes["/sheet.csv"] = (503, {}, b"")
+    sleep = data.time.sleep
+    intervals = []
+
+    def wait(seconds):
+        if seconds == 3600:
+            # the first download was just done, the first refresh waits for an interval
+            assert len(fixture_server.requested("/sheet.csv")) == 2 * len(intervals)
+            intervals.append(seconds)
+            if len(intervals) == 3:
+                raise KeyboardInterrupt
+        else:
+            sleep(seconds)
+
+    monkeypatch.setattr(data.time, "sleep", wait)
+    with pytest.raises(KeyboardInterrupt):
+        data._refresh_forever(fixture_server.url("/sheet.csv"), sheet, 3600, client)
+
+    assert len(fixture_server.requested("/sheet.csv")) == 4
+    assert not os.path.exists(sheet)
@@ -0,0 +1,33 @@
+import shelve
+
+import descriptions
+import pytest
+from descriptions import DescriptionStore, get_description_store
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = DescriptionStore(tmp_path / "descriptions.sqlite")
+    monkeypatch.setattr(descriptions, "DescriptionStore", lambda: store)
+    monkeypatch.setattr(descriptions, "LEGACY_SHELVE", str(tmp_path / "description"))
+    get_description_store.clear()
+    yield store
+    get_description_store.clear()
+
+
+def test_shelve_is_migrated_once(store):
+    with shelve.open(descriptions.LEGACY_SHELVE, "c") as db:
+        db["AIAAIC1"] = "A description"
+
+    assert get_description_store() is store
+    assert store.get(["AIAAIC1"]).tolist() == ["A description"]
+
+    # a store already filled is left as it is
+    store.put_many([("AIAAIC1", None, "A newer description", None, None, None)])
+    get_description_store.clear()
+    get_description_store()
+    assert store.get(["AIAAIC1"]).tolist() == ["A newer description"]
+
+
+def test_no_shelve(store):
+    assert len(get_description_store()) == 0
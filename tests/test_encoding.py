@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+from data import C
+from encoding import Values, normalize
+from facets import SEMICOLON_SEPARATOR
+
+
+def vocabulary(dataset, col) -> set:
+    return set(dataset.values(col).vocabulary)
+
+
+def test_semicolon_separated_columns(dataset):
+    # their values may have commas
+    assert "Replicate voice, face" in vocabulary(dataset, C.purpose)
+    assert {"Identify personality type", "Predict behaviour"} <= vocabulary(dataset, C.purpose)
+    assert {"Google", "OpenAI"} <= vocabulary(dataset, C.developer)
+
+
+def test_comma_separated_columns(dataset):
+    assert not any("," in value or ";" in value for value in vocabulary(dataset, C.country))
+
+
+def decoded(values: Values) -> list[set]:
+    # the values of every row
+    rows = [set() for _ in range(values.rows.max(initial=-1) + 1)]
+    for row, code in zip(values.rows, values.codes):
+        rows[row].add(values.vocabulary[code])
+    return rows
+
+
+def test_normalize():
+    series = pd.Series(
+        ["USA; UK", " usa ,China", None, "USA; UK", "uk;;  ", "China, china"], index=list("abcdef")
+    )
+    values = normalize(series)
+
+    # named after their most frequent spelling, sorted
+    assert list(values.vocabulary) == ["China", "UK", "USA"]
+    assert decoded(values) == [
+        {"USA", "UK"}, {"USA", "China"}, set(), {"USA", "UK"}, {"UK"}, {"China"}
+    ]
+    # sorted by row, a value appears once per row
+    assert (np.diff(values.rows) >= 0).all()
+    assert len(values.rows) == 8
+
+
+def test_normalize_with_synonyms():
+    synonyms = {"neural network": "neural networks", "neural networks": "neural networks"}
+    series = pd.Series(["Neural network; Deep learning", "neural networks, Neural Network"])
+    values = normalize(series, synonyms)
+
+    assert list(values.vocabulary) == ["Deep learning", "neural networks"]
+    # two synonyms in the same cell are counted once
+    assert decoded(values) == [{"Deep learning", "neural networks"}, {"neural networks"}]
+
+
+def test_normalize_with_a_separator():
+    series = pd.Series(["Meta Platforms, Inc.; Google", "Google"])
+    values = normalize(series, separator=SEMICOLON_SEPARATOR)
+    assert decoded(values) == [{"Meta Platforms, Inc.", "Google"}, {"Google"}]
+
+
+def test_normalize_nothing():
+    values = normalize(pd.Series([None, "", " ; "], dtype=object))
+    assert len(values.rows) == len(values.codes) == len(values.vocabulary) == 0
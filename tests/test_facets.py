@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+import pytest
+from data import C
+from facets import FacetEngine, from_bitset, split_values, to_bitset
+
+COLUMNS = [C.country, C.sector, C.technology, C.risks, C.type]
+
+
+def exploded(dataset, col) -> pd.Series:
+    # the (normalized) values of a column, one per row and value, indexed by position
+    values = dataset.values(col)
+    return pd.Series(values.vocabulary[values.codes], index=values.rows)
+
+
+def assert_counts_equal(counts: pd.Series, expected: pd.Series):
+    # the values without any row are not in the value_counts
+    pd.testing.assert_series_equal(
+        counts[counts > 0].sort_index(),
+        expected.sort_index(),
+        check_names=False,
+        check_dtype=False,
+    )
+
+
+@pytest.fixture(scope="module")
+def facets(dataset):
+    return FacetEngine(dataset.df.index, dataset.values)
+
+
+@pytest.fixture(scope="module")
+def masks(dataset):
+    rng = np.random.default_rng(0)
+    size = len(dataset)
+    return [np.ones(size, dtype=bool), np.zeros(size, dtype=bool), rng.random(size) < 0.5]
+
+
+@pytest.mark.parametrize("size", [0, 1, 63, 64, 65, 1000])
+def test_bitset_round_trip(size):
+    mask = np.random.default_rng(size).random(size) < 0.3
+    n_words = (size + 63) // 64 + 1
+    bitset = to_bitset(mask, n_words)
+    assert bitset.dtype == np.uint64 and bitset.shape == (n_words,)
+    assert int(np.bitwise_count(bitset).sum()) == mask.sum()
+    np.testing.assert_array_equal(from_bitset(bitset, size), mask)
+
+
+@pytest.mark.parametrize("col", COLUMNS)
+def test_counts(dataset, facets, masks, col):
+    values = exploded(dataset, col)
+    for mask in masks:
+        expected = values[mask[values.index]].value_counts()
+        counts = facets.counts(col, mask)
+        assert counts.sum() == expected.sum()
+        assert_counts_equal(counts, expected)
+
+
+def test_counts_of_the_cells(dataset, facets, masks):
+    # the value_counts of the split cells, where no spelling is merged
+    for mask in masks:
+        expected = split_values(dataset.df[C.country][mask]).value_counts()
+        counts = facets.counts(C.country, mask)
+        assert_counts_equal(counts, expected)
+
+
+@pytest.mark.parametrize("col", COLUMNS)
+def test_mask(dataset, facets, col):
+    values = exploded(dataset, col)
+    for selected in [values.value_counts().index[:1], values.value_counts().index[1:3]]:
+        expected = np.zeros(len(dataset), dtype=bool)
+        expected[values.index[values.isin(selected)]] = True
+        np.testing.assert_array_equal(facets.mask(col, list(selected)), expected)
+
+
+def test_mask_of_no_values(dataset, facets):
+    assert not facets.mask(C.country, []).any()
+    assert not facets.mask(C.country, ["Atlantis"]).any()
+    np.testing.assert_array_equal(
+        facets.mask(C.country, ["Atlantis", "USA"]), facets.mask(C.country, ["USA"])
+    )
@@ -0,0 +1,145 @@
+import socket
+
+import fetch
+import pytest
+import requests
+from fetch import CircuitBreaker, CircuitOpenError, FetchClient, retry_delay
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    # the delays between the retries, not actually waited
+    sleeps = []
+    monkeypatch.setattr(fetch.time, "sleep", sleeps.append)
+    return sleeps
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(fetch.time, "monotonic", lambda: now[0])
+    return now
+
+
+def responses(*routes):
+    # the routes of the successive requests, the last one repeated
+    routes = list(routes)
+    return lambda request: routes.pop(0) if len(routes) > 1 else routes[0]
+
+
+def closed_port_url() -> str:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    return f"http://127.0.0.1:{port}/"
+
+
+def test_server_errors_are_retried(fixture_server, sleeps):
+    fixture_server.routes["/"] = responses((503, {}, b""), (500, {}, b""), (200, {}, b"ok"))
+    client = FetchClient(retries=2, backoff=1)
+
+    assert client.get(fixture_server.url("/")).content == b"ok"
+    assert len(fixture_server.requested("/")) == 3
+    # jittered exponential backoff
+    assert 0.5 <= sleeps[0] <= 1.5 and 1 <= sleeps[1] <= 3
+
+
+def test_retries_are_exhausted(fixture_server, sleeps):
+    fixture_server.routes["/"] = (502, {}, b"")
+    client = FetchClient(retries=2, backoff=0)
+
+    with pytest.raises(requests.HTTPError):
+        client.get(fixture_server.url("/"))
+    assert len(fixture_server.requested("/")) == 3
+    assert client.breaker.failures == {f"127.0.0.1:{fixture_server.httpd.server_port}": 1}
+
+
+def test_client_errors_are_not_retried(fixture_server, sleeps):
+    fixture_server.routes["/"] = (404, {}, b"")
+    client = FetchClient(retries=2, backoff=0)
+
+    with pytest.raises(requests.HTTPError):
+        client.get(fixture_server.url("/"))
+    assert len(fixture_server.requested("/")) == 1
+    assert client.breaker.failures == {}
+
+
+def test_connection_errors_are_retried(sleeps):
+    client = FetchClient(retries=2, backoff=0)
+    with pytest.raises(requests.ConnectionError):
+        client.get(closed_port_url())
+    assert len(sleeps) == 2
+
+
+def test_retry_after(fixture_server, sleeps):
+    fixture_server.routes["/"] = responses((429, {"Retry-After": "2"}, b""), (200, {}, b"ok"))
+    FetchClient(retries=1, backoff=0).get(fixture_server.url("/"))
+    assert sleeps == [2]
+
+
+def test_retry_after_is_capped(fixture_server, sleeps):
+    fixture_server.routes["/"] = responses((503, {"Retry-After": "3600"}, b""), (200, {}, b"ok"))
+    client = FetchClient(retries=1, backoff=0.1, timeout=(1, 4))
+
+    assert client.get(fixture_server.url("/")).content == b"ok"
+    assert sleeps == [4]
+
+
+def test_retry_delay():
+    response = requests.Response()
+    response.headers["Retry-After"] = "3600"
+    assert retry_delay(0, 1, response, max_delay=30) == 30
+    # a longer backoff is not shortened
+    assert retry_delay(6, 1, response, max_delay=30) == 64
+    response.headers["Retry-After"] = "Wed, 21 Oct 2026 07:28:00 GMT"
+    assert 0.5 <= retry_delay(0, 1, response) <= 1.5
+
+
+def test_circuit_breaker(clock):
+    breaker = CircuitBreaker(threshold=2, cooldown=60)
+    breaker.failure("a")
+    assert breaker.allow("a")
+
+    # open: the requests fail fast, the other hosts are not affected
+    breaker.failure("a")
+    assert not breaker.allow("a")
+    assert breaker.allow("b")
+    clock[0] += 59
+    assert not breaker.allow("a")
+
+    # half-open: a single request is let through
+    clock[0] += 1
+    assert breaker.allow("a")
+    assert not breaker.allow("a")
+
+    # its failure opens the circuit again
+    breaker.failure("a")
+    clock[0] += 59
+    assert not breaker.allow("a")
+
+    # the success of the next one closes it
+    clock[0] += 1
+    assert breaker.allow("a")
+    breaker.success("a")
+    assert breaker.allow("a") and breaker.allow("a")
+    breaker.failure("a")
+    assert breaker.allow("a")
+
+
+def test_open_circuit_is_not_requested(fixture_server, sleeps, clock):
+    fixture_server.routes["/"] = (503, {}, b"")
+    client = FetchClient(retries=0, breaker=CircuitBreaker(threshold=2, cooldown=60))
+    url = fixture_server.url("/")
+
+    for _ in range(2):
+        with pytest.raises(requests.HTTPError):
+            client.get(url)
+    with pytest.raises(CircuitOpenError):
+        client.get(url)
+    assert len(fixture_server.requested("/")) == 2
+
+    # after the cooldown, the host is back
+    fixture_server.routes["/"] = (200, {}, b"ok")
+    clock[0] += 60
+    assert client.get(url).content == b"ok"
+    assert client.get(url).content == b"ok"
@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import pytest
+import utils
+from data import C
+from utils import gen_sankey
+
+COLUMNS = [C.country, C.sector, C.technology]
+
+
+@pytest.fixture(autouse=True)
+def shared_dataset(dataset, monkeypatch):
+    # the values of the rows are looked up in the shared dataset
+    monkeypatch.setattr(utils, "get_dataset", lambda *args, **kwargs: dataset)
+
+
+def reference(dataset, df, cols, top_n=None, weights=None):
+    """The nodes, as (column position, label), and their links (source, target) -> weight."""
+    weights = pd.Series(1.0 if weights is None else weights, index=df.index)
+    nodes, exploded = [], []
+    for position, col in enumerate(cols):
+        values = dataset.values(col)
+        cells = pd.DataFrame(
+            {"row": dataset.df.index[values.rows], "value": values.vocabulary[values.codes]}
+        )
+        cells = cells[cells["row"].isin(df.index)]
+
+        counts = cells["value"].value_counts()
+        counts = counts.sort_index().sort_values(ascending=False, kind="stable")
+        kept = counts.index if top_n is None else counts.index[:top_n]
+        column_labels = sorted(kept)
+        if len(kept) < len(counts):
+            column_labels.append("Other")
+            cells["value"] = cells["value"].where(cells["value"].isin(kept), "Other")
+
+        cells["node"] = cells["value"].map(lambda value: (position, value))
+        exploded.append(cells[["row", "node"]].drop_duplicates())
+        nodes += [(position, label) for label in column_labels]
+
+    links = {}
+    for source, target in zip(exploded[:-1], exploded[1:]):
+        for _, pair in source.merge(target, on="row").iterrows():
+            key = (pair["node_x"], pair["node_y"])
+            links[key] = links.get(key, 0) + weights[pair["row"]]
+    return nodes, links
+
+
+def check(fig, nodes, links):
+    assert fig["data"][0]["node"]["label"] == [label for _, label in nodes]
+    link = fig["data"][0]["link"]
+    assert {
+        (nodes[source], nodes[target]): value
+        for source, target, value in zip(link["source"], link["target"], link["value"])
+    } == pytest.approx(links)
+
+
+@pytest.mark.parametrize("top_n", [None, 1, 3])
+@pytest.mark.parametrize("cols", [COLUMNS[:2], COLUMNS, [C.country, C.country]])
+def test_gen_sankey(dataset, cols, top_n):
+    check(gen_sankey(dataset.df, cols, top_n=top_n), *reference(dataset, dataset.df, cols, top_n))
+
+
+def test_gen_sankey_of_some_rows_with_weights(dataset):
+    df = dataset.df.iloc[::2].assign(weight=np.arange(1, len(dataset) // 2 + 1))
+    check(
+        gen_sankey(df, COLUMNS, value_cols="weight", top_n=2),
+        *reference(dataset, df, COLUMNS, top_n=2, weights=df["weight"]),
+    )
+
+
+def test_gen_sankey_of_a_single_column(dataset):
+    fig = gen_sankey(dataset.df, [C.country])
+    assert len(fig["data"][0]["link"]["source"]) == 0
@@ -0,0 +1,70 @@
+import pytest
+from encoding import Values
+from taxonomy import compile_taxonomy, load_taxonomy, unmapped_values
+
+DOCUMENT = {
+    "version": 3,
+    "Technology(ies)": {
+        "neural networks": ["Neural network", " neural networks "],
+        "facial recognition": ["facial recognition", "Facial recogniton"],
+    },
+    "Country(ies)": {"USA": ["US", "United States"]},
+}
+
+
+def vocabulary(*values) -> Values:
+    return Values(None, None, list(values))
+
+
+def test_compile_taxonomy():
+    assert compile_taxonomy(DOCUMENT) == {
+        "Technology(ies)": {
+            "neural network": "neural networks",
+            "neural networks": "neural networks",
+            "facial recognition": "facial recognition",
+            "facial recogniton": "facial recognition",
+        },
+        "Country(ies)": {"us": "USA", "united states": "USA"},
+    }
+
+
+def test_conflicts():
+    # the same value twice in a group, or in two columns, is fine
+    compile_taxonomy({"A": {"x": ["a", "A"]}, "B": {"y": ["a"]}})
+
+    with pytest.raises(ValueError, match='"Neural Network" is merged into both'):
+        compile_taxonomy(
+            {"Technology(ies)": {"neural networks": ["neural network"], "nn": ["Neural Network"]}}
+        )
+
+
+def test_load_taxonomy(tmp_path):
+    path = tmp_path / "taxonomy.toml"
+    path.write_text('version = 2\n\n["Country(ies)"]\n"USA" = ["US", "United States"]\n')
+    taxonomy = load_taxonomy(path)
+
+    assert taxonomy.version == 2
+    assert taxonomy.synonyms == {"Country(ies)": {"us": "USA", "united states": "USA"}}
+    # the digest changes with the content
+    edited = tmp_path / "edited.toml"
+    edited.write_text('version = 2\n\n["Country(ies)"]\n"USA" = ["US"]\n')
+    assert load_taxonomy(edited).digest != taxonomy.digest
+
+
+def test_unmapped_values():
+    taxonomy = load_taxonomy()._replace(synonyms=compile_taxonomy(DOCUMENT))
+    previous = {
+        "Technology(ies)": vocabulary("neural networks", "Chatbot"),
+        "Country(ies)": vocabulary("USA"),
+    }
+    values = {
+        # known as a synonym, a merged value, from the previous version, or new
+        "Technology(ies)": vocabulary("Facial recogniton", "Neural Networks", "chatbot", "LLM"),
+        "Country(ies)": vocabulary("USA", "United States"),
+        # not in the taxonomy
+        "Sector(s)": vocabulary("Banking"),
+    }
+
+    assert unmapped_values(values, previous, taxonomy) == {"Technology(ies)": ["LLM"]}
+    # no previous version of a column, no report
+    assert unmapped_values(values, {}, taxonomy) == {}
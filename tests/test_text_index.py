@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+import pytest
+import text_index
+from text_index import TrigramIndex
+from utils import keywords_mask
+
+KEYWORDS = ["facebook", "faceapp", "deep learning", "ai", "x", "gpt", "", "zzz", "gle; op"]
+
+
+def contains(df: pd.DataFrame, keyword: str) -> np.ndarray:
+    # the row-wise search the index replaced
+    return (
+        df.fillna("")
+        .apply(lambda row: row.astype(str).str.lower().str.contains(keyword, regex=False).any(), axis=1)
+        .to_numpy()
+    )
+
+
+@pytest.fixture(scope="module")
+def index(dataset):
+    return TrigramIndex(dataset.df)
+
+
+@pytest.mark.parametrize("keyword", KEYWORDS)
+def test_lookup(dataset, index, keyword):
+    np.testing.assert_array_equal(index.lookup(keyword), contains(dataset.df, keyword))
+
+
+def test_lookup_is_literal(index):
+    # neither a regular expression, nor across two columns
+    assert not index.lookup("face.*").any()
+    assert not index.lookup("issue2024").any()
+
+
+def test_keywords_mask(dataset, index):
+    expected = contains(dataset.df, "facebook") & ~contains(dataset.df, "incident")
+    np.testing.assert_array_equal(keywords_mask("Facebook, ~incident", index), expected)
+    np.testing.assert_array_equal(keywords_mask("", index), np.ones(len(dataset), dtype=bool))
+    np.testing.assert_array_equal(keywords_mask("~", index), np.ones(len(dataset), dtype=bool))
+
+
+def test_align(dataset, index):
+    mask = index.lookup("faceapp")
+    shuffled = dataset.df.index[::-1]
+    np.testing.assert_array_equal(index.align(mask, shuffled), mask[::-1])
+
+
+def test_chunks(monkeypatch):
+    df = pd.DataFrame(
+        {
+            "name": ["Café", "ab", None, "Naïve Bayes", "", "cafés", "abc"],
+            "country": ["France", "", "USA", "日本", "USA", None, "France"],
+        }
+    )
+    monkeypatch.setattr(text_index, "CHUNK_ROWS", 3)
+    index = TrigramIndex(df)
+    for keyword in ["caf", "café", "é", "ab", "b", "日本", "日", "usa", "fr", "ïve ba"]:
+        np.testing.assert_array_equal(index.lookup(keyword), contains(df, keyword), keyword)
+
+
+def test_empty():
+    index = TrigramIndex(pd.DataFrame({"name": pd.Series([], dtype=object)}))
+    assert index.lookup("abc").shape == (0,)
+    assert index.lookup("a").shape == (0,)
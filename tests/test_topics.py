@@ -0,0 +1,67 @@
+from pathlib import Path
+
+import joblib
+import pytest
+import topics
+from data import build_snapshot
+from descriptions import DescriptionStore
+from topics import build_topic_model, descriptions_digest
+
+SHEET = Path(__file__).parent / "fixtures" / "sheet.csv"
+WORDS = ["facial recognition", "chatbot", "deepfake video", "credit scoring", "self-driving car"]
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = DescriptionStore(tmp_path / "descriptions.sqlite")
+    monkeypatch.setattr(topics, "DescriptionStore", lambda: store)
+    monkeypatch.setattr(topics, "TOPICS_DIR", tmp_path / "topics")
+    return store
+
+
+def describe(store, ids, suffix=""):
+    store.put_many(
+        (incident_id, None, f"An incident about a {WORDS[i % len(WORDS)]}{suffix}.", None, None, None)
+        for i, incident_id in enumerate(ids)
+    )
+
+
+def build(store, dataset):
+    digest = descriptions_digest(store.get(dataset.df.index))
+    return Path(build_topic_model(str(build_snapshot(SHEET)), digest, 3))
+
+
+def test_no_description(store, dataset):
+    assert descriptions_digest(store.get(dataset.df.index)) is None
+    with pytest.raises(ValueError):
+        build_topic_model(str(build_snapshot(SHEET)), None, 3)
+
+
+def test_digest(store, dataset):
+    ids = dataset.df.index
+    describe(store, ids[:4])
+    digest = descriptions_digest(store.get(ids))
+    assert descriptions_digest(store.get(ids[::-1])) == digest
+
+    store.touch(ids[:4])
+    assert descriptions_digest(store.get(ids)) == digest
+    describe(store, ids[:1], " (edited)")
+    assert descriptions_digest(store.get(ids)) != digest
+
+
+def test_new_descriptions_are_folded_in(store, dataset, monkeypatch):
+    ids = dataset.df.index
+    describe(store, ids[:-1])
+    first = build(store, dataset)
+    assert set(joblib.load(first)["doc_topics"].index) == set(ids[:-1])
+
+    # the next scraped description gets a model of its own, updated from the first one
+    def fit_topics(*args):
+        raise AssertionError("The model was refitted")
+
+    monkeypatch.setattr(topics, "fit_topics", fit_topics)
+    describe(store, ids[-1:])
+    second = build(store, dataset)
+    assert second != first
+    assert set(joblib.load(second)["doc_topics"].index) == set(ids)
+    assert build(store, dataset) == second